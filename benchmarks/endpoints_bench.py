@@ -0,0 +1,456 @@
+#!/usr/bin/env python
+
+"""endpoints_bench.py
+
+Benchmark every ConferenceApi endpoint and main.py handler locally on the
+App Engine testbed stubs (datastore, memcache, taskqueue, ...; no network).
+
+Seeds N conferences, M sessions and U profiles through the API itself,
+then times each endpoint/handler and prints JSON with latency
+percentiles, RPC counts and entities read/written per call, so runs
+before and after a change can be compared.
+
+Run from the app directory with the App Engine SDK on PYTHONPATH:
+
+    python benchmarks/endpoints_bench.py --conferences 200 --sessions 2000 \\
+        --profiles 500 --iterations 50 > before.json
+
+$Id$
+
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+import dev_appserver
+dev_appserver.fix_sys_path()
+
+from google.appengine.datastore import datastore_stub_util
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+import endpoints
+from protorpc import message_types
+
+CITIES = ['London', 'Paris', 'Tokyo', 'Chicago', 'Berlin', 'Sydney']
+TOPICS = ['Medical Innovations', 'Programming Languages', 'Web Technologies',
+          'Movie Making', 'Health and Nutrition']
+TYPES = ['keynote', 'workshop', 'lecture', 'panel']
+SPEAKER_COUNT = 200
+BULK_SESSIONS = 100
+STATS = ['rpcs', 'entitiesRead', 'entitiesWritten', 'memcacheHits',
+         'memcacheMisses', 'tasksEnqueued']
+
+
+def setUpTestbed():
+    """Activate in-memory service stubs for the app."""
+    tb = testbed.Testbed()
+    tb.activate()
+    tb.setup_env(app_id='dev~conference-bench', overwrite=True)
+    policy = datastore_stub_util.PseudoRandomHRConsistencyPolicy(probability=1)
+    tb.init_datastore_v3_stub(consistency_policy=policy)
+    tb.init_memcache_stub()
+    tb.init_taskqueue_stub(root_path=APP_DIR)
+    tb.init_user_stub()
+    tb.init_urlfetch_stub()
+    tb.init_mail_stub()
+    tb.init_search_stub()
+    tb.init_app_identity_stub()
+    return tb
+
+
+def signIn(email):
+    """Make endpoints.get_current_user() return a user for email."""
+    os.environ['ENDPOINTS_AUTH_EMAIL'] = email
+    os.environ['ENDPOINTS_AUTH_DOMAIN'] = 'gmail.com'
+
+
+def ignoreServiceErrors(func, *args):
+    try:
+        return func(*args)
+    except endpoints.ServiceException:
+        return None
+
+
+class PerRequestApi(object):
+    """ConferenceApi stand-in that runs every call on a new instance, as
+    each request gets its own in production; no state carries over."""
+
+    def __getattr__(self, name):
+        from conference import ConferenceApi
+        return getattr(ConferenceApi(), name)
+
+
+class Bench(object):
+    """Bench -- seeded data plus the request factories for each endpoint"""
+
+    def __init__(self, api, conferences, sessions, profiles):
+        from models import Conference, ConferenceForm, Session
+        from conference import SESS_POST_REQUEST
+
+        self.api = api
+        self.users = ['user%d@example.com' % i for i in range(profiles)]
+        self.organizers = ['organizer%d@example.com' % i
+                           for i in range(max(1, conferences // 20))]
+        for email in self.users + self.organizers:
+            signIn(email)
+            api.getProfile(message_types.VoidMessage())
+
+        for i in range(conferences):
+            signIn(self.organizers[i % len(self.organizers)])
+            month = random.randint(1, 12)
+            api.createConference(ConferenceForm(
+                name='Conference %d' % i,
+                description='Benchmark conference %d' % i,
+                city=random.choice(CITIES),
+                topics=random.sample(TOPICS, 2),
+                startDate='2016-%02d-10' % month,
+                endDate='2016-%02d-12' % month,
+                maxAttendees=random.choice([5, 10, 50, 200])))
+        confs = Conference.query().fetch()
+        self.wscks = [conf.key.urlsafe() for conf in confs]
+        self.owner = dict((conf.key.urlsafe(), conf.organizerUserId) for conf in confs)
+
+        for i in range(sessions):
+            wsck = random.choice(self.wscks)
+            signIn(self.owner[wsck])
+            api.createSession(SESS_POST_REQUEST.combined_message_class(
+                websafeConferenceKey=wsck,
+                name='Session %d' % i,
+                highlights=['Highlight'],
+                speaker='Speaker %d' % random.randrange(SPEAKER_COUNT),
+                typeOfSession=random.choice(TYPES),
+                date='2016-06-%02d' % random.randint(10, 12),
+                startTime='%02d:%02d' % (random.randint(8, 20), random.choice([0, 30])),
+                duration='01:00'))
+        self.sessionKeys = [key.urlsafe() for key in
+                            Session.query().iter(keys_only=True)]
+
+        for email in self.users:
+            signIn(email)
+            for wsck in random.sample(self.wscks, min(2, len(self.wscks))):
+                ignoreServiceErrors(self.register, wsck)
+            for sck in random.sample(self.sessionKeys, min(3, len(self.sessionKeys))):
+                ignoreServiceErrors(self.addToWishlist, sck)
+        self.registered = []
+
+    # - - - request helpers - - - - - - - - - - - - - - - - - - -
+
+    def conf(self, wsck=None):
+        from conference import CONF_GET_REQUEST
+        return CONF_GET_REQUEST.combined_message_class(
+            websafeConferenceKey=wsck or random.choice(self.wscks))
+
+    def register(self, wsck):
+        return self.api.registerForConference(self.conf(wsck))
+
+    def addToWishlist(self, sck):
+        from conference import SESS_GET_REQUEST
+        return self.api.addSessionToWishlist(
+            SESS_GET_REQUEST.combined_message_class(SessionKey=sck))
+
+    def asUser(self):
+        signIn(random.choice(self.users))
+
+    def asOrganizer(self):
+        wsck = random.choice(self.wscks)
+        signIn(self.owner[wsck])
+        return wsck
+
+    # - - - endpoint cases - - - - - - - - - - - - - - - - - - - -
+
+    def endpointCases(self):
+        """Return {endpoint name: zero-argument call}."""
+        from conference import (CONF_POST_REQUEST, SESS_POST_REQUEST,
+            SESS_BULK_POST_REQUEST, SESS_GET_REQUEST, SESS_TYPE_POST_REQUEST, SESS_SPEAKER_POST_REQUEST,
+            PAGE_GET_REQUEST, RPC_GET_REQUEST, SPEAKER_ANNOUNCEMENT_GET_REQUEST,
+            RPC_PAGE_GET_REQUEST, CONF_PAGE_GET_REQUEST, SEARCH_GET_REQUEST,
+            SESS_WINDOW_GET_REQUEST, ANNOUNCEMENT_GET_REQUEST, SESS_LIST_POST_REQUEST)
+        from models import (ConferenceForm, ConferenceQueryForm,
+            ConferenceQueryForms, ProfileMiniForm, SessionFirstQueryForm,
+            SessionSecondQueryForm, SessionQueryForm, SessionQueryForms,
+            SessionForm, SessionKeysForm)
+        api = self.api
+        void = message_types.VoidMessage
+
+        def createConference():
+            signIn(random.choice(self.organizers))
+            return api.createConference(ConferenceForm(
+                name='New conference', city=random.choice(CITIES),
+                topics=[random.choice(TOPICS)], startDate='2016-06-10',
+                endDate='2016-06-11', maxAttendees=100))
+
+        def updateConference():
+            wsck = self.asOrganizer()
+            return api.updateConference(CONF_POST_REQUEST.combined_message_class(
+                websafeConferenceKey=wsck, description='Updated %f' % time.time()))
+
+        def queryConferences():
+            filters = random.choice([
+                [ConferenceQueryForm(field='CITY', operator='EQ', value=random.choice(CITIES))],
+                [ConferenceQueryForm(field='TOPIC', operator='EQ', value=random.choice(TOPICS)),
+                 ConferenceQueryForm(field='MONTH', operator='EQ', value='6')],
+                [ConferenceQueryForm(field='MAX_ATTENDEES', operator='GT', value='10')],
+                [],
+            ])
+            return api.queryConferences(ConferenceQueryForms(filters=filters))
+
+        def registerForConference():
+            self.asUser()
+            wsck = random.choice(self.wscks)
+            self.registered.append((os.environ['ENDPOINTS_AUTH_EMAIL'], wsck))
+            return self.register(wsck)
+
+        def unregisterFromConference():
+            if self.registered:
+                signIn(self.registered[-1][0])
+                wsck = self.registered.pop()[1]
+            else:
+                self.asUser()
+                wsck = random.choice(self.wscks)
+            return api.unregisterFromConference(self.conf(wsck))
+
+        def createSession():
+            wsck = self.asOrganizer()
+            return api.createSession(SESS_POST_REQUEST.combined_message_class(
+                websafeConferenceKey=wsck, name='New session',
+                speaker='Speaker %d' % random.randrange(SPEAKER_COUNT),
+                typeOfSession=random.choice(TYPES), date='2016-06-10',
+                startTime='10:00', duration='01:00'))
+
+        def createSessions():
+            wsck = self.asOrganizer()
+            return api.createSessions(SESS_BULK_POST_REQUEST.combined_message_class(
+                websafeConferenceKey=wsck, items=[SessionForm(
+                    name='Bulk session %d' % i,
+                    speaker='Speaker %d' % random.randrange(SPEAKER_COUNT),
+                    typeOfSession=random.choice(TYPES), date='2016-06-10',
+                    startTime='%02d:00' % (9 + i % 8), duration='01:00')
+                    for i in range(BULK_SESSIONS)]))
+
+        def sessionKey():
+            return SESS_GET_REQUEST.combined_message_class(
+                SessionKey=random.choice(self.sessionKeys))
+
+        def withUser(func):
+            def call():
+                self.asUser()
+                return func()
+            return call
+
+        def withOrganizer(func):
+            def call():
+                signIn(random.choice(self.organizers))
+                return func()
+            return call
+
+        return {
+            'createConference': createConference,
+            'updateConference': updateConference,
+            'getConference': lambda: api.getConference(self.conf()),
+            'getConferencesCreated': withOrganizer(lambda: api.getConferencesCreated(void())),
+            'queryConferences': queryConferences,
+            'getProfile': withUser(lambda: api.getProfile(void())),
+            'saveProfile': withUser(lambda: api.saveProfile(
+                ProfileMiniForm(displayName='User %d' % random.randrange(1000)))),
+            'getAnnouncement': lambda: api.getAnnouncement(
+                ANNOUNCEMENT_GET_REQUEST.combined_message_class()),
+            'getConferenceFacets': lambda: api.getConferenceFacets(void()),
+            'getConferencesToAttend': withUser(lambda: api.getConferencesToAttend(
+                RPC_PAGE_GET_REQUEST.combined_message_class())),
+            'getConferenceAttendees': lambda: api.getConferenceAttendees(
+                CONF_PAGE_GET_REQUEST.combined_message_class(
+                    websafeConferenceKey=self.asOrganizer())),
+            'registerForConference': registerForConference,
+            'unregisterFromConference': unregisterFromConference,
+            'filterPlayground': lambda: api.filterPlayground(void()),
+            'createSession': createSession,
+            'createSessions': createSessions,
+            'getConferenceSessions': lambda: api.getConferenceSessions(
+                SESS_LIST_POST_REQUEST.combined_message_class(
+                    websafeConferenceKey=random.choice(self.wscks))),
+            'getConferenceSessionsByType': lambda: api.getConferenceSessionsByType(
+                SESS_TYPE_POST_REQUEST.combined_message_class(
+                    websafeConferenceKey=random.choice(self.wscks),
+                    typeOfSession=','.join(random.sample(TYPES, 2)),
+                    orderByStartTime=True)),
+            'getSessionsBySpeaker': lambda: api.getSessionsBySpeaker(
+                SESS_SPEAKER_POST_REQUEST.combined_message_class(
+                    speaker='Speaker %d' % random.randrange(SPEAKER_COUNT))),
+            'getSpeakers': lambda: api.getSpeakers(
+                PAGE_GET_REQUEST.combined_message_class()),
+            'addSessionToWishlist': withUser(lambda: api.addSessionToWishlist(sessionKey())),
+            'getSessionsInWishlist': withUser(lambda: api.getSessionsInWishlist(
+                RPC_PAGE_GET_REQUEST.combined_message_class())),
+            'getWishlistByConference': withUser(lambda: api.getWishlistByConference(
+                RPC_PAGE_GET_REQUEST.combined_message_class())),
+            'addSessionsToWishlist': withUser(lambda: api.addSessionsToWishlist(
+                SessionKeysForm(sessionKeys=random.sample(self.sessionKeys, min(5, len(self.sessionKeys)))))),
+            'removeSessionsFromWishlist': withUser(lambda: api.removeSessionsFromWishlist(
+                SessionKeysForm(sessionKeys=random.sample(self.sessionKeys, min(5, len(self.sessionKeys)))))),
+            'deleteSessionInWishlist': withUser(lambda: api.deleteSessionInWishlist(sessionKey())),
+            'getWishlistConflicts': withUser(lambda: api.getWishlistConflicts(sessionKey())),
+            'getSessionsInWindow': lambda: api.getSessionsInWindow(
+                SESS_WINDOW_GET_REQUEST.combined_message_class(
+                    date='2016-06-10', startTime='14:00', endTime='16:00')),
+            'getFeaturedSpeaker': lambda: api.getFeaturedSpeaker(
+                SPEAKER_ANNOUNCEMENT_GET_REQUEST.combined_message_class(
+                    websafeConferenceKey=random.choice(self.wscks))),
+            'querySessions': lambda: api.querySessions(SessionQueryForms(filters=[
+                SessionQueryForm(field='DATE', operator='EQ', value='2016-06-11'),
+                SessionQueryForm(field='START_TIME', operator='GTEQ', value='12:00'),
+                SessionQueryForm(field='TYPE_OF_SESSION', operator='NE', value='workshop'),
+            ])),
+            'sessionQueryByDateStartTime': lambda: api.sessionQueryByDateStartTime(
+                SessionFirstQueryForm(date='2016-06-10', startTime='12:00')),
+            'sessionQueryByDateStartTimeType': lambda: api.sessionQueryByDateStartTimeType(
+                SessionSecondQueryForm(date='2016-06-10', startTime='12:00',
+                                       typeOfSession=random.choice(TYPES))),
+            'searchConferences': lambda: api.searchConferences(
+                SEARCH_GET_REQUEST.combined_message_class(
+                    query=random.choice(TOPICS).split()[0])),
+            'searchSessions': lambda: api.searchSessions(
+                SEARCH_GET_REQUEST.combined_message_class(
+                    query='speaker:"Speaker %d"' % random.randrange(SPEAKER_COUNT))),
+            'challengeQuery': lambda: api.challengeQuery(
+                PAGE_GET_REQUEST.combined_message_class()),
+        }
+
+    def handlerCases(self):
+        """Return {handler path: zero-argument call} for main.py."""
+        import webapp2
+        import bulkdata
+        import main
+
+        def call(path, method='GET', body=None, **params):
+            def run():
+                request = webapp2.Request.blank(path, POST=params if method == 'POST' else None)
+                request.method = method
+                if body is not None:
+                    request.body = body
+                return request.get_response(main.app)
+            return run
+
+        wsck = random.choice(self.wscks)
+        # new copies of a few conferences: incomplete keys get fresh ids
+        records = [json.loads(line) for line in
+                   bulkdata.exportPage('Conference:', pageSize=10)[0]]
+        for record in records:
+            record['key'][-1] = None
+        importBody = ''.join(json.dumps(record) + '\n' for record in records)
+        return {
+            '/crons/set_announcement': call('/crons/set_announcement'),
+            '/crons/send_mail': call('/crons/send_mail'),
+            '/tasks/send_confirmation_email': call('/tasks/send_confirmation_email', 'POST',
+                email='organizer0@example.com', conferenceInfo='Benchmark'),
+            '/tasks/determine_featured_speaker': call('/tasks/determine_featured_speaker', 'POST',
+                websafeConferenceKey=wsck),
+            '/tasks/sync_seats': call('/tasks/sync_seats', 'POST',
+                websafeConferenceKey=wsck),
+            '/admin/export': call('/admin/export'),
+            '/admin/import': call('/admin/import', 'POST', body=importBody),
+            '/admin/migrate_profiles': call('/admin/migrate_profiles', 'POST'),
+            '/admin/backfill_speakers': call('/admin/backfill_speakers', 'POST'),
+            '/admin/backfill_session_times': call('/admin/backfill_session_times', 'POST'),
+            '/admin/reindex': call('/admin/reindex', 'POST'),
+            '/admin/rebuild_facets': call('/admin/rebuild_facets', 'POST'),
+            '/admin/stats': call('/admin/stats'),
+            '/admin/cache_stats': call('/admin/cache_stats'),
+            '/admin/mail_stats': call('/admin/mail_stats'),
+        }
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of sorted values."""
+    return values[max(0, int(round(pct / 100.0 * len(values))) - 1)]
+
+
+def measure(func, iterations):
+    """Call func iterations times; return a summary dict."""
+    import rpcstats
+    latencies, errors, totals = [], 0, dict((stat, 0) for stat in STATS)
+    datastoreRpcs = 0
+    for _ in range(iterations):
+        # every call is a new request: nothing in the ndb context cache
+        ndb.get_context().clear_cache()
+        with rpcstats.counting() as counts:
+            start = time.time()
+            try:
+                func()
+            except endpoints.ServiceException:
+                errors += 1
+            latencies.append((time.time() - start) * 1000)
+        for stat in STATS:
+            totals[stat] += counts[stat]
+        datastoreRpcs += sum(n for name, n in counts.items()
+                             if name.startswith('datastore_v3.'))
+    latencies.sort()
+    summary = {
+        'calls': iterations,
+        'errors': errors,
+        'latencyMs': {
+            'p50': percentile(latencies, 50),
+            'p90': percentile(latencies, 90),
+            'p99': percentile(latencies, 99),
+            'max': latencies[-1],
+            'mean': sum(latencies) / len(latencies),
+        },
+        'datastoreRpcs': float(datastoreRpcs) / iterations,
+    }
+    for stat in STATS:
+        summary[stat] = float(totals[stat]) / iterations
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--conferences', type=int, default=100)
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--profiles', type=int, default=200)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', help='comma separated endpoint/handler names')
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    tb = setUpTestbed()
+    try:
+        from conference import ConferenceApi
+        api = PerRequestApi()
+        started = time.time()
+        bench = Bench(api, args.conferences, args.sessions, args.profiles)
+        seedSeconds = time.time() - started
+
+        only = set(args.only.split(',')) if args.only else None
+        results = {'endpoints': {}, 'handlers': {}}
+        for group, cases in (('endpoints', bench.endpointCases()),
+                             ('handlers', bench.handlerCases())):
+            for name in sorted(cases):
+                if only is None or name in only:
+                    results[group][name] = measure(cases[name], args.iterations)
+
+        import main
+        endpointNames = set(name for name, attr in vars(ConferenceApi).items()
+                            if hasattr(attr, 'method_info'))
+        handlerPaths = set(route.template for route in main.app.router.match_routes)
+        print(json.dumps({
+            'params': vars(args),
+            'seedSeconds': seedSeconds,
+            'endpoints': results['endpoints'],
+            'handlers': results['handlers'],
+            'notBenchmarked': sorted(endpointNames - set(bench.endpointCases())),
+            'handlersNotBenchmarked': sorted(handlerPaths - set(bench.handlerCases())),
+        }, indent=2, sort_keys=True))
+    finally:
+        tb.deactivate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+"""serializers_bench.py
+
+Micro-benchmark: per-item cost of copying Conference and Session entities
+to their form messages, reflective copy vs. precompiled FormSerializer.
+
+Run from the app directory with the App Engine SDK on PYTHONPATH:
+
+    python benchmarks/serializers_bench.py [count]
+
+$Id$
+
+"""
+
+import os
+import sys
+import timeit
+from datetime import date
+from datetime import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dev_appserver
+dev_appserver.fix_sys_path()
+os.environ.setdefault('APPLICATION_ID', 'dev~bench')
+
+from google.appengine.ext import ndb
+
+from conference import CONFERENCE_SERIALIZER
+from conference import SESSION_SERIALIZER
+from models import Conference
+from models import ConferenceForm
+from models import Profile
+from models import Session
+from models import SessionForm
+
+
+def reflectiveConferenceCopy(conf, displayName):
+    """Conference copy as done before FormSerializer."""
+    cf = ConferenceForm()
+    for field in cf.all_fields():
+        if hasattr(conf, field.name):
+            if field.name.endswith('Date'):
+                setattr(cf, field.name, str(getattr(conf, field.name)))
+            else:
+                setattr(cf, field.name, getattr(conf, field.name))
+        elif field.name == "websafeKey":
+            setattr(cf, field.name, conf.key.urlsafe())
+    if displayName:
+        setattr(cf, 'organizerDisplayName', displayName)
+    cf.check_initialized()
+    return cf
+
+
+def reflectiveSessionCopy(sess):
+    """Session copy as done before FormSerializer."""
+    se = SessionForm()
+    for field in se.all_fields():
+        if hasattr(sess, field.name):
+            if field.name.endswith('date'):
+                setattr(se, field.name, str(getattr(sess, field.name)))
+            elif field.name.endswith('Time'):
+                setattr(se, field.name, str(getattr(sess, field.name)))
+            elif field.name.endswith('duration'):
+                setattr(se, field.name, str(getattr(sess, field.name)))
+            else:
+                setattr(se, field.name, getattr(sess, field.name))
+        elif field.name == "websafeConferenceKey":
+            setattr(se, field.name, sess.key.parent().urlsafe())
+        elif field.name == "websafeSessionKey":
+            setattr(se, field.name, sess.key.urlsafe())
+    se.check_initialized()
+    return se
+
+
+def makeEntities(count):
+    """Build count in-memory Conferences and Sessions (no datastore)."""
+    p_key = ndb.Key(Profile, 'bench@example.com')
+    confs, sessions = [], []
+    for i in range(count):
+        c_key = ndb.Key(Conference, i + 1, parent=p_key)
+        confs.append(Conference(key=c_key, name='Conference %d' % i,
+            description='Benchmark conference', organizerUserId=p_key.id(),
+            topics=['Web', 'Cloud'], city='London',
+            startDate=date(2016, 6, 1), month=6, endDate=date(2016, 6, 3),
+            maxAttendees=100, seatsAvailable=50))
+        sessions.append(Session(key=ndb.Key(Session, 1, parent=c_key),
+            name='Session %d' % i, highlights=['One', 'Two'],
+            speaker='Speaker %d' % (i % 100), duration=time(1, 30),
+            typeOfSession='workshop', date=date(2016, 6, 1),
+            startTime=time(10, 0)))
+    return confs, sessions
+
+
+def perItem(func, items, repeat=3):
+    """Best per-item time in microseconds."""
+    best = min(timeit.repeat(lambda: [func(item) for item in items],
+        number=1, repeat=repeat))
+    return best / len(items) * 1e6
+
+
+def main(count=10000):
+    confs, sessions = makeEntities(count)
+    rows = [
+        ('Conference', perItem(lambda c: reflectiveConferenceCopy(c, 'Organizer'), confs),
+            perItem(lambda c: CONFERENCE_SERIALIZER.toForm(c, organizerDisplayName='Organizer'), confs)),
+        ('Session', perItem(reflectiveSessionCopy, sessions),
+            perItem(SESSION_SERIALIZER.toForm, sessions)),
+    ]
+    print('%d entities, microseconds per item' % count)
+    print('%-12s %12s %12s %8s' % ('model', 'reflective', 'serializer', 'speedup'))
+    for model, old, new in rows:
+        print('%-12s %12.2f %12.2f %7.2fx' % (model, old, new, old / new))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+
+"""bulkdata.py
+
+Udacity conference server-side Python App Engine bulk import and export
+
+Profiles, Conferences, Registrations, Sessions and WishlistEntries are
+dumped as JSON lines, one entity per line, parents before children:
+
+    {"key": ["Profile", "a@b.com", "Conference", 12], "name": "PyCon", ...}
+
+Keys are flat (kind, id) paths, so a dump can be loaded into another
+application; an id of null is allocated on import.  Import only inserts:
+records whose key is already stored are skipped, so lines replayed after
+a lost checkpoint are harmless.
+
+$Id$
+
+"""
+
+import json
+from datetime import datetime
+
+from google.appengine.api import datastore_errors
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+from conference import CONFERENCES_GENERATION
+from conference import ConferenceApi
+from models import Conference
+from models import Profile
+from models import Registration
+from models import Session
+from models import WishlistEntry
+
+import cache
+import searchindex
+import seats
+
+# parents and referenced entities first
+EXPORT_KINDS = [Profile, Conference, Registration, Session, WishlistEntry]
+EXPORT_PAGE_SIZE = 500
+IMPORT_BATCH_SIZE = 200
+IMPORT_TIME_BUDGET = 30     # seconds of import per request
+# Profile properties holding urlsafe keys; dumped as flat paths
+KEY_LIST_FIELDS = ('conferenceKeysToAttend', 'sessionWishListKeys')
+# properties rebuilt on import
+DERIVED_FIELDS = ('seatShards', 'month')
+
+_MODELS = {model._get_kind(): model for model in EXPORT_KINDS}
+
+
+def _fields(model):
+    """Yield (name, property) of the model's dumped properties."""
+    for name, prop in model._properties.iteritems():
+        if not isinstance(prop, ndb.ComputedProperty) and name not in DERIVED_FIELDS:
+            yield name, prop
+
+
+def toRecord(entity):
+    """Return the JSON-able dict of an entity."""
+    record = {'key': entity.key.flat()}
+    for name, prop in _fields(type(entity)):
+        value = getattr(entity, name)
+        if name in KEY_LIST_FIELDS:
+            value = [ndb.Key(urlsafe=v).flat() for v in value]
+        elif value and isinstance(prop, ndb.KeyProperty):
+            value = value.flat()
+        elif value and isinstance(prop, ndb.DateProperty):
+            value = value.isoformat()
+        elif value and isinstance(prop, ndb.TimeProperty):
+            value = value.strftime('%H:%M')
+        record[name] = value
+    return record
+
+
+def fromRecord(record):
+    """Return an entity for a dict made by toRecord(); its key may be
+    incomplete.  Raise ValueError for records that do not fit.
+    """
+    flat = record.get('key') if isinstance(record, dict) else None
+    if not flat or not isinstance(flat, list) or len(flat) % 2 or \
+            flat[-2] not in _MODELS:
+        raise ValueError('bad key: %r' % (flat,))
+    model = _MODELS[flat[-2]]
+    data = {}
+    try:
+        for name, prop in _fields(model):
+            value = record.get(name)
+            if value is None:
+                continue
+            if name in KEY_LIST_FIELDS:
+                value = [ndb.Key(flat=path).urlsafe() for path in value]
+            elif isinstance(prop, ndb.KeyProperty):
+                value = ndb.Key(flat=value)
+            elif isinstance(prop, ndb.DateProperty):
+                value = datetime.strptime(value[:10], "%Y-%m-%d").date()
+            elif isinstance(prop, ndb.TimeProperty):
+                value = datetime.strptime(value[:5], "%H:%M").time()
+            data[name] = value
+        entity = model(key=ndb.Key(flat=flat), **data)
+        entity._check_initialized()
+    except (TypeError, datastore_errors.Error) as e:
+        raise ValueError(str(e))
+    if model is Conference:
+        entity.month = entity.startDate.month if entity.startDate else 0
+    elif model is Registration:
+        # ids are websafe keys, which name the application
+        entity.key = Registration.keyFor(entity.key.parent(), entity.conference)
+    elif model is WishlistEntry:
+        entity.key = WishlistEntry.keyFor(entity.key.parent(), entity.session)
+    return entity
+
+
+# - - - Export - - - - - - - - - - - - - - - - - - - - - - - -
+
+def exportPage(token=None, pageSize=EXPORT_PAGE_SIZE):
+    """Return (JSON lines, next token) for one page of the dump.  A token
+    of None starts the dump; a next token of None ends it.
+    """
+    kind, _, urlsafe = (token or EXPORT_KINDS[0]._get_kind() + ':').partition(':')
+    if kind not in _MODELS:
+        raise ValueError('bad export cursor: %r' % token)
+    model = _MODELS[kind]
+    cursor = Cursor(urlsafe=urlsafe) if urlsafe else None
+    entities, next_cursor, more = model.query().fetch_page(
+        pageSize, start_cursor=cursor)
+    if model is Conference:
+        # dump exact seats; shards are rebuilt on import
+        seats.loadSeats(entities)
+
+    lines = [json.dumps(toRecord(entity)) for entity in entities]
+    if more and next_cursor:
+        return lines, '%s:%s' % (kind, next_cursor.urlsafe())
+    position = EXPORT_KINDS.index(model) + 1
+    if position < len(EXPORT_KINDS):
+        return lines, EXPORT_KINDS[position]._get_kind() + ':'
+    return lines, None
+
+
+# - - - Import - - - - - - - - - - - - - - - - - - - - - - - -
+
+def importLines(lines, checkpoint=0):
+    """Import JSON lines, skipping the first checkpoint lines, in batches
+    of IMPORT_BATCH_SIZE.  Yield the checkpoint (number of lines done)
+    after each batch is stored; raise ValueError naming a bad line.
+    """
+    batch = []
+    number = checkpoint
+    for number, line in enumerate(lines, 1):
+        if number <= checkpoint or not line.strip():
+            continue
+        try:
+            batch.append(fromRecord(json.loads(line)))
+        except ValueError as e:
+            raise ValueError('line %d: %s' % (number, e))
+        if len(batch) == IMPORT_BATCH_SIZE:
+            _storeBatch(batch)
+            batch = []
+            yield number
+    if batch:
+        _storeBatch(batch)
+    yield number
+
+
+def _allocateIds(entities):
+    """Give incomplete keys pre-allocated ids and reserve the given
+    numeric ids, with one allocate_ids() call per (kind, parent).
+    """
+    groups = {}
+    for entity in entities:
+        groups.setdefault((type(entity), entity.key.parent()), []).append(entity)
+    for (model, parent), group in groups.iteritems():
+        incomplete = [e for e in group if e.key.id() is None]
+        numeric = [e.key.id() for e in group if isinstance(e.key.id(), (int, long))]
+        if numeric:
+            model.allocate_ids(max=max(numeric), parent=parent)
+        if incomplete:
+            first, last = model.allocate_ids(size=len(incomplete), parent=parent)
+            for new_id, entity in zip(range(first, last + 1), incomplete):
+                entity.key = ndb.Key(model, new_id, parent=parent)
+
+
+def _storeBatch(entities):
+    """Store the entities not stored yet, with their derived state."""
+    _allocateIds(entities)
+    stored = ndb.get_multi([entity.key for entity in entities])
+    entities = [e for e, s in zip(entities, stored) if s is None]
+
+    confs = [e for e in entities if isinstance(e, Conference)]
+    shards = []
+    for conf in confs:
+        shards.extend(seats.newShards(conf, conf.seatsAvailable or 0))
+    ndb.put_multi(shards + [e for e in entities if not isinstance(e, Session)])
+    for conf in confs:
+        ConferenceApi._changeFacets(set(), ConferenceApi._conferenceFacets(conf))
+        ConferenceApi._onSeatsChanged(conf, None, conf.seatsAvailable)
+    if confs:
+        cache.bumpGeneration(CONFERENCES_GENERATION)
+    searchindex.indexConferences(confs)
+
+    # sessions go through the same speaker accounting as createSessions
+    byConference = {}
+    for sess in entities:
+        if isinstance(sess, Session):
+            byConference.setdefault(sess.key.parent(), []).append(sess)
+    for c_key, sessions in byConference.iteritems():
+        for batch in ConferenceApi._sessionBatches(sessions):
+            ConferenceApi._putSessions(batch)
+        cache.bumpGeneration(ConferenceApi._sessionsCacheName(c_key))
+        ConferenceApi._scheduleFeaturedSpeaker(c_key)
+        searchindex.indexSessions(sessions)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+"""cache.py
+
+Udacity conference server-side Python App Engine memcache helpers;
+read-through caching of ProtoRPC messages with generation numbers
+
+Every cached item belongs to a named generation.  Writers bump the
+generation instead of deleting items, so readers simply stop finding
+entries written under the previous generation.
+
+$Id$
+
+"""
+
+import hashlib
+import time
+from collections import Counter
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+from protorpc import protojson
+
+GENERATION_PREFIX = "GEN:"
+ITEM_PREFIX = "ITEM:"
+STATS_PREFIX = "CACHE_STATS:"
+ITEM_TTL = 10 * 60
+STATS_FLUSH_EVERY = 50
+
+_stats = Counter()
+
+
+def _newGeneration():
+    # a restarted generation must never collide with an evicted one
+    return int(time.time() * 1000)
+
+
+def getGeneration(name):
+    """Return current generation number for name."""
+    key = GENERATION_PREFIX + name
+    gen = memcache.get(key)
+    if gen is None:
+        gen = _newGeneration()
+        if not memcache.add(key, gen):
+            gen = memcache.get(key) or gen
+    return gen
+
+
+def bumpGeneration(name):
+    """Invalidate everything cached under name."""
+    memcache.incr(GENERATION_PREFIX + name, initial_value=_newGeneration())
+
+
+def bumpGenerationOnCommit(name):
+    """Bump generation once the current transaction (if any) commits."""
+    ndb.get_context().call_on_commit(lambda: bumpGeneration(name))
+
+
+def _count(stat):
+    _stats[stat] += 1
+    if sum(_stats.values()) >= STATS_FLUSH_EVERY:
+        _flushStats()
+
+
+def _flushStats():
+    if _stats:
+        memcache.offset_multi(dict(_stats), key_prefix=STATS_PREFIX,
+            initial_value=0)
+        _stats.clear()
+
+
+def getStats():
+    """Return (hits, misses) across all instances."""
+    _flushStats()
+    stats = memcache.get_multi(['hits', 'misses'], key_prefix=STATS_PREFIX)
+    return stats.get('hits', 0), stats.get('misses', 0)
+
+
+def variantKey(*parts):
+    """Return a short memcache-safe digest of hashable key parts."""
+    return hashlib.sha1(repr(parts)).hexdigest()
+
+
+def etagFor(generation):
+    """Return the ETag of whatever is cached under a generation."""
+    return '"%d"' % generation
+
+
+def etagMatches(ifNoneMatch, etag):
+    """Return whether an If-None-Match value lists etag."""
+    for tag in (ifNoneMatch or '').split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == '*' or tag.strip('"') == etag.strip('"'):
+            return True
+    return False
+
+
+def readThrough(name, messageType, loader, ttl=ITEM_TTL, variant=None,
+                generation=None):
+    """Return cached message for name, calling loader() on a miss.
+
+    Items with different variants (see variantKey()) are cached apart but
+    share the generation of name.  A generation the caller already read
+    saves reading it again.
+    """
+    # read generation before loading so a concurrent bump is never lost
+    if generation is None:
+        generation = getGeneration(name)
+    key = '%s%s:%d' % (ITEM_PREFIX, name, generation)
+    if variant:
+        key += ':' + variant
+    encoded = memcache.get(key)
+    if encoded is not None:
+        _count('hits')
+        return protojson.decode_message(messageType, encoded)
+
+    _count('misses')
+    message = loader()
+    memcache.set(key, protojson.encode_message(message), time=ttl)
+    return message
@@ -16,21 +16,36 @@ __author__ = 'wesc+api@google.com (Wesley Chun)'
 from datetime import datetime
 from datetime import date
 from datetime import time
+import operator
+import random
 
 import endpoints
 from protorpc import messages
 from protorpc import message_types
 from protorpc import remote
 
+from google.appengine.api import datastore_errors
 from google.appengine.api import memcache
 from google.appengine.api import taskqueue
+from google.appengine.datastore.datastore_query import Cursor
 from google.appengine.ext import ndb
 
 from models import ConflictException
+from models import NearlySoldOut
+from models import ConferenceFacets
+from models import ConferenceFacetsForm
+from models import FacetCountForm
 from models import Profile
+from models import Registration
+from models import AttendeeForm
+from models import AttendeeForms
+from models import WishlistEntry
+from models import SessionKeysForm
+from models import WishlistGroupForm
+from models import WishlistForms
 from models import ProfileMiniForm
 from models import ProfileForm
-from models import StringMessage
+from models import AnnouncementForm
 from models import BooleanMessage
 from models import Conference
 from models import ConferenceForm
@@ -43,21 +58,57 @@ from models import SessionForm
 from models import SessionForms
 from models import SessionFirstQueryForm
 from models import SessionSecondQueryForm
+from models import SessionQueryForm
+from models import SessionQueryForms
+from models import Speaker
+from models import ConferenceSpeaker
+from models import SpeakerForm
+from models import SpeakerForms
 
 from settings import WEB_CLIENT_ID
 from settings import ANDROID_CLIENT_ID
 from settings import IOS_CLIENT_ID
 from settings import ANDROID_AUDIENCE
+from settings import QUERY_SEATS_STALENESS
 
+from serializers import FormSerializer
+from utils import addCoalescedTask
 from utils import getUserId
+from utils import getUserIdAsync
+
+import cache
+import instrument
+import mailer
+import rpcstats
+import searchindex
+import seats
 
 EMAIL_SCOPE = endpoints.EMAIL_SCOPE
 API_EXPLORER_CLIENT_ID = endpoints.API_EXPLORER_CLIENT_ID
 MEMCACHE_ANNOUNCEMENTS_KEY = "RECENT_ANNOUNCEMENTS"
 ANNOUNCEMENT_TPL = ('Last chance to attend! The following conferences '
                     'are nearly sold out: %s')
+NEARLY_SOLD_OUT_SEATS = 5
 MEMCACHE_SPEAKER_ANNOUNCEMENTS_KEY = "SPEAKER_ANNOUNCEMENTS"
+ANNOUNCEMENT_GENERATION = 'announcement'
 SPEAKER_ANNOUNCEMENT_TPL = ('Featured Speaker %s is will be speaking in %s Sessions')
+CONFERENCES_GENERATION = 'conferences'   # cached queryConferences pages
+MEMCACHE_QUERY_SEATS_KEY = "QUERY_SEATS_BUMPED"
+FACET_SHARDS = 10
+# the original singleton (id 1) is the first shard
+FACET_KEYS = [ndb.Key(ConferenceFacets, i + 1) for i in range(FACET_SHARDS)]
+# ConferenceFacetsForm field of each facet
+FACET_FIELDS = {'city': 'cities', 'topic': 'topics', 'month': 'months', 'seats': 'seats'}
+FEATURED_SPEAKER_INTERVAL = 10   # seconds over which session tasks coalesce
+MEMCACHE_DISPLAY_NAME_PREFIX = "DISPLAY_NAME:"
+DISPLAY_NAME_TTL = 60 * 60
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+RESIDUAL_BATCH_SIZE = 100
+MAX_SCANNED_PER_PAGE = 1000
+MAX_BULK_SESSIONS = 500
+SESSION_BATCH_SIZE = 100
+MAX_BATCH_SPEAKERS = 24   # xg limit of 25 groups, less the conference
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 DEFAULTS = {
@@ -71,6 +122,9 @@ SESSION_DEFAULTS = {
     "speaker": "Default Speaker",
     "highlights": [ "Default", "Highlight" ],
 }
+# sessions without a speaker are not counted on a global Speaker entity,
+# which every such session in every conference would contend on
+DEFAULT_SPEAKER_ID = Speaker.normalize(SESSION_DEFAULTS["speaker"])
 
 
 OPERATORS = {
@@ -93,12 +147,85 @@ SESSION_FIELDS =    {
             'DATE': 'date',
             'TYPE_OF_SESSION': 'typeOfSession',
             'START_TIME': 'startTime',
+            'SPEAKER': 'speakerId',
+            }
+
+# preferred Session properties for the one datastore range filter, when
+# bounds tie: the finer the values, the narrower a range tends to be
+SESSION_RANGE_FIELDS = ['startTime', 'date', 'typeOfSession', 'speakerId']
+
+# (equality properties, range property) pairs served by a composite index
+# in index.yaml; keep the two in step.  A range with no other equality
+# filter uses the built-in single property index.
+SESSION_RANGE_INDEXES = frozenset(
+    (frozenset(equalities), rangeField) for equalities, rangeField in [
+        (['date'], 'startTime'),
+        (['typeOfSession'], 'startTime'),
+        (['speakerId'], 'startTime'),
+        (['date', 'typeOfSession'], 'startTime'),
+        (['date', 'speakerId'], 'startTime'),
+        (['typeOfSession', 'speakerId'], 'startTime'),
+        (['date', 'typeOfSession', 'speakerId'], 'startTime'),
+        (['typeOfSession'], 'date'),
+        (['speakerId'], 'date'),
+    ])
+
+# same operators applied to ndb properties (query) or values (residual)
+COMPARISONS =   {
+            '=':    operator.eq,
+            '>':    operator.gt,
+            '>=':   operator.ge,
+            '<':    operator.lt,
+            '<=':   operator.le,
+            '!=':   operator.ne,
             }
 
 
+CONFERENCE_SERIALIZER = FormSerializer(Conference, ConferenceForm,
+    # convert Date to date string; just copy others
+    converters={'startDate': str, 'endDate': str},
+    keyFields={'websafeKey': lambda key: key.urlsafe()},
+)
+
+SESSION_SERIALIZER = FormSerializer(Session, SessionForm,
+    # convert date, time and duration to strings; just copy others
+    converters={'date': str, 'startTime': str, 'duration': str},
+    keyFields={
+        'websafeConferenceKey': lambda key: key.parent().urlsafe(),
+        'websafeSessionKey': lambda key: key.urlsafe(),
+    },
+)
+
+
 CONF_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     websafeConferenceKey=messages.StringField(1),
+    reportRpcs=messages.BooleanField(2),
+    ifNoneMatch=messages.StringField(3),
+)
+
+ANNOUNCEMENT_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    ifNoneMatch=messages.StringField(1),
+)
+
+RPC_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    reportRpcs=messages.BooleanField(1),
+)
+
+CONF_PAGE_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    pageSize=messages.IntegerField(2, variant=messages.Variant.INT32),
+    cursor=messages.StringField(3),
+)
+
+RPC_PAGE_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    reportRpcs=messages.BooleanField(1),
+    pageSize=messages.IntegerField(2, variant=messages.Variant.INT32),
+    cursor=messages.StringField(3),
 )
 
 CONF_POST_REQUEST = endpoints.ResourceContainer(
@@ -117,15 +244,58 @@ SESS_POST_REQUEST = endpoints.ResourceContainer(
     websafeConferenceKey=messages.StringField(1),
 )
 
+SESS_LIST_POST_REQUEST = endpoints.ResourceContainer(
+    SessionForm,
+    websafeConferenceKey=messages.StringField(1),
+    ifNoneMatch=messages.StringField(2),
+)
+
+SESS_BULK_POST_REQUEST = endpoints.ResourceContainer(
+    SessionForms,
+    websafeConferenceKey=messages.StringField(1),
+)
+
 SESS_TYPE_POST_REQUEST = endpoints.ResourceContainer(
     SessionForm,
     websafeConferenceKey=messages.StringField(1),
     typeOfSession=messages.StringField(2),
+    orderByStartTime=messages.BooleanField(3),
 )
 
 SESS_SPEAKER_POST_REQUEST = endpoints.ResourceContainer(
     SessionForm,
     speaker=messages.StringField(1),
+    pageSize=messages.IntegerField(2, variant=messages.Variant.INT32),
+    cursor=messages.StringField(3),
+)
+
+SPEAKER_ANNOUNCEMENT_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    ifNoneMatch=messages.StringField(2),
+)
+
+SEARCH_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    query=messages.StringField(1),
+    pageSize=messages.IntegerField(2, variant=messages.Variant.INT32),
+    cursor=messages.StringField(3),
+)
+
+SESS_WINDOW_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    date=messages.StringField(1),
+    startTime=messages.StringField(2),
+    endTime=messages.StringField(3),
+    websafeConferenceKey=messages.StringField(4),
+    pageSize=messages.IntegerField(5, variant=messages.Variant.INT32),
+    cursor=messages.StringField(6),
+)
+
+PAGE_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    pageSize=messages.IntegerField(1, variant=messages.Variant.INT32),
+    cursor=messages.StringField(2),
 )
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -141,20 +311,7 @@ class ConferenceApi(remote.Service):
 
     def _copyConferenceToForm(self, conf, displayName):
         """Copy relevant fields from Conference to ConferenceForm."""
-        cf = ConferenceForm()
-        for field in cf.all_fields():
-            if hasattr(conf, field.name):
-                # convert Date to date string; just copy others
-                if field.name.endswith('Date'):
-                    setattr(cf, field.name, str(getattr(conf, field.name)))
-                else:
-                    setattr(cf, field.name, getattr(conf, field.name))
-            elif field.name == "websafeKey":
-                setattr(cf, field.name, conf.key.urlsafe())
-        if displayName:
-            setattr(cf, 'organizerDisplayName', displayName)
-        cf.check_initialized()
-        return cf
+        return CONFERENCE_SERIALIZER.toForm(conf, organizerDisplayName=displayName)
 
 
     def _createConferenceObject(self, request):
@@ -199,28 +356,32 @@ class ConferenceApi(remote.Service):
         data['key'] = c_key
         data['organizerUserId'] = request.organizerUserId = user_id
 
-        # create Conference, send email to organizer confirming
-        # creation of Conference & return (modified) ConferenceForm
-        Conference(**data).put()
-        taskqueue.add(params={'email': user.email(),
-            'conferenceInfo': repr(request)},
-            url='/tasks/send_confirmation_email'
-        )
+        # create Conference with its seats spread over shards, send email
+        # to organizer confirming creation & return (modified) ConferenceForm
+        conf = Conference(**data)
+        ndb.put_multi(seats.newShards(conf, data['seatsAvailable']) + [conf])
+        self._changeFacets(set(), self._conferenceFacets(conf))
+        self._onSeatsChanged(conf, None, conf.seatsAvailable)
+        cache.bumpGeneration(CONFERENCES_GENERATION)
+        searchindex.indexConferences([conf])
+        mailer.queueConfirmation(user.email(), c_key)
         return request
 
 
-    @ndb.transactional()
+    @ndb.transactional(xg=True)
     def _updateConferenceObject(self, request):
         user = endpoints.get_current_user()
         if not user:
             raise endpoints.UnauthorizedException('Authorization required')
-        user_id = getUserId(user)
+        # read the conference while the user id resolves
+        confFuture = ndb.Key(urlsafe=request.websafeConferenceKey).get_async()
+        user_id = getUserIdAsync(user).get_result()
 
         # copy ConferenceForm/ProtoRPC Message into dict
         data = {field.name: getattr(request, field.name) for field in request.all_fields()}
 
         # update existing conference
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        conf = confFuture.get_result()
         # check that conference exists
         if not conf:
             raise endpoints.NotFoundException(
@@ -233,10 +394,13 @@ class ConferenceApi(remote.Service):
 
         # Not getting all the fields, so don't create a new object; just
         # copy relevant fields from ConferenceForm to Conference object
+        facets = self._conferenceFacets(conf)
+        maxAttendees = conf.maxAttendees or 0
+        storedSeats = conf.seatsAvailable
         for field in request.all_fields():
             data = getattr(request, field.name)
-            # only copy fields where we get data
-            if data not in (None, []):
+            # only copy fields where we get data; seats follow maxAttendees
+            if data not in (None, []) and field.name != 'seatsAvailable':
                 # special handling for dates (convert string to Date)
                 if field.name in ('startDate', 'endDate'):
                     data = datetime.strptime(data, "%Y-%m-%d").date()
@@ -244,19 +408,37 @@ class ConferenceApi(remote.Service):
                         conf.month = data.month
                 # write to Conference object
                 setattr(conf, field.name, data)
+
+        # add or remove seats when capacity changes
+        delta = (conf.maxAttendees or 0) - maxAttendees
+        if delta:
+            if conf.seatShards:
+                available = seats.adjustCapacity(conf, delta)
+            else:
+                available = (conf.seatsAvailable or 0) + delta
+            if available is None or available < 0:
+                raise endpoints.BadRequestException(
+                    'maxAttendees cannot be lower than registered attendees.')
+            conf.seatsAvailable = available
+        else:
+            seats.loadSeats([conf])
         conf.put()
-        prof = ndb.Key(Profile, user_id).get()
-        return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
+        self._changeFacets(facets, self._conferenceFacets(conf))
+        self._onSeatsChanged(conf, storedSeats, conf.seatsAvailable)
+        cache.bumpGenerationOnCommit(self._confCacheName(conf.key))
+        cache.bumpGenerationOnCommit(CONFERENCES_GENERATION)
+        ndb.get_context().call_on_commit(lambda: searchindex.indexConferences([conf]))
+        return self._copyConferenceToForm(conf, self._getDisplayName(user_id))
 
 
-    @endpoints.method(ConferenceForm, ConferenceForm, path='conference',
+    @instrument.method(ConferenceForm, ConferenceForm, path='conference',
             http_method='POST', name='createConference')
     def createConference(self, request):
         """Create new conference."""
         return self._createConferenceObject(request)
 
 
-    @endpoints.method(CONF_POST_REQUEST, ConferenceForm,
+    @instrument.method(CONF_POST_REQUEST, ConferenceForm,
             path='conference/{websafeConferenceKey}',
             http_method='PUT', name='updateConference')
     def updateConference(self, request):
@@ -264,22 +446,42 @@ class ConferenceApi(remote.Service):
         return self._updateConferenceObject(request)
 
 
-    @endpoints.method(CONF_GET_REQUEST, ConferenceForm,
+    @instrument.method(CONF_GET_REQUEST, ConferenceForm,
             path='conference/{websafeConferenceKey}',
             http_method='GET', name='getConference')
     def getConference(self, request):
         """Return requested conference (by websafeConferenceKey)."""
-        # get Conference object from request; bail if not found
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        c_key = ndb.Key(urlsafe=request.websafeConferenceKey)
+        name = self._confCacheName(c_key)
+        with rpcstats.counting() as counts:
+            cf = self._readVersioned(request, name, ConferenceForm,
+                lambda generation: cache.readThrough(name, ConferenceForm,
+                    lambda: self._getConferenceFormAsync(c_key).get_result(),
+                    generation=generation))
+        if request.reportRpcs:
+            cf.rpcCount = counts['rpcs']
+        return cf
+
+
+    @ndb.tasklet
+    def _getConferenceFormAsync(self, c_key):
+        """Read Conference from datastore and return it as ConferenceForm."""
+        # the organizer's Profile is the Conference's parent and seat shard
+        # keys derive from the Conference key: fetch all of them at once
+        conf, names, _ = yield (c_key.get_async(),
+            self._getDisplayNamesAsync([c_key.parent().id()]),
+            seats.prefetchShardsAsync([c_key]))
+        # bail if not found
         if not conf:
             raise endpoints.NotFoundException(
-                'No conference found with key: %s' % request.websafeConferenceKey)
-        prof = conf.key.parent().get()
+                'No conference found with key: %s' % c_key.urlsafe())
+        yield seats.loadSeatsAsync([conf])
         # return ConferenceForm
-        return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
+        raise ndb.Return(self._copyConferenceToForm(conf,
+            names.get(conf.organizerUserId)))
 
 
-    @endpoints.method(message_types.VoidMessage, ConferenceForms,
+    @instrument.method(message_types.VoidMessage, ConferenceForms,
             path='getConferencesCreated',
             http_method='POST', name='getConferencesCreated')
     def getConferencesCreated(self, request):
@@ -291,11 +493,11 @@ class ConferenceApi(remote.Service):
         user_id = getUserId(user)
 
         # create ancestor query for all key matches for this user
-        confs = Conference.query(ancestor=ndb.Key(Profile, user_id))
-        prof = ndb.Key(Profile, user_id).get()
+        confs = seats.loadSeats(Conference.query(ancestor=ndb.Key(Profile, user_id)).fetch())
+        displayName = self._getDisplayName(user_id)
         # return set of ConferenceForm objects per Conference
         return ConferenceForms(
-            items=[self._copyConferenceToForm(conf, getattr(prof, 'displayName')) for conf in confs]
+            items=[self._copyConferenceToForm(conf, displayName) for conf in confs]
         )
 
 
@@ -312,8 +514,6 @@ class ConferenceApi(remote.Service):
             q = q.order(Conference.name)
 
         for filtr in filters:
-            if filtr["field"] in ["month", "maxAttendees"]:
-                filtr["value"] = int(filtr["value"])
             formatted_query = ndb.query.FilterNode(filtr["field"], filtr["operator"], filtr["value"])
             q = q.filter(formatted_query)
         return q
@@ -332,6 +532,12 @@ class ConferenceApi(remote.Service):
                 filtr["operator"] = OPERATORS[filtr["operator"]]
             except KeyError:
                 raise endpoints.BadRequestException("Filter contains invalid field or operator.")
+            if filtr["field"] in ["month", "maxAttendees"]:
+                try:
+                    filtr["value"] = int(filtr["value"])
+                except (TypeError, ValueError):
+                    raise endpoints.BadRequestException(
+                        "Invalid value for %s filter: %s" % (filtr["field"], filtr["value"]))
 
             # Every operation except "=" is an inequality
             if filtr["operator"] != "=":
@@ -347,28 +553,60 @@ class ConferenceApi(remote.Service):
         return (inequality_field, formatted_filters)
 
 
-    @endpoints.method(ConferenceQueryForms, ConferenceForms,
+    def _pageArgs(self, pageSize, cursor):
+        """Validate paging fields; return (page size, start Cursor)."""
+        pageSize = pageSize or DEFAULT_PAGE_SIZE
+        if pageSize < 1 or pageSize > MAX_PAGE_SIZE:
+            raise endpoints.BadRequestException(
+                "pageSize must be between 1 and %d." % MAX_PAGE_SIZE)
+        try:
+            startCursor = Cursor(urlsafe=cursor) if cursor else None
+        except datastore_errors.BadValueError:
+            raise endpoints.BadRequestException("Invalid cursor: %s" % cursor)
+        return pageSize, startCursor
+
+
+    def _fetchPage(self, query, pageSize, cursor, **options):
+        """Fetch a single page of query results; return (entities, next cursor)."""
+        pageSize, startCursor = self._pageArgs(pageSize, cursor)
+        entities, nextCursor, more = query.fetch_page(
+            pageSize, start_cursor=startCursor, **options)
+        return entities, (nextCursor.urlsafe() if more and nextCursor else None)
+
+
+    @instrument.method(ConferenceQueryForms, ConferenceForms,
             path='queryConferences',
             http_method='POST',
             name='queryConferences')
     def queryConferences(self, request):
-        """Query for conferences."""
-        conferences = self._getQuery(request)
-
-        # need to fetch organiser displayName from profiles
-        # get all keys and use get_multi for speed
-        organisers = [(ndb.Key(Profile, conf.organizerUserId)) for conf in conferences]
-        profiles = ndb.get_multi(organisers)
-
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
+        """Query for conferences, one page at a time."""
+        # pages are cached per canonical filter set, so the same filters
+        # in any order share one entry
+        _, filters = self._formatFilters(request.filters)
+        pageSize, _ = self._pageArgs(request.pageSize, request.cursor)
+        variant = cache.variantKey(
+            sorted(set((f["field"], f["operator"], f["value"]) for f in filters)),
+            pageSize, request.cursor)
+        return cache.readThrough(CONFERENCES_GENERATION, ConferenceForms,
+            lambda: self._queryConferencesPage(
+                self._getQuery(request), pageSize, request.cursor),
+            ttl=QUERY_SEATS_STALENESS or cache.ITEM_TTL, variant=variant)
+
+
+    def _queryConferencesPage(self, query, pageSize, cursor):
+        """Return ConferenceForms of one page of query results."""
+        # fetch the page once; it is reused for organisers and the response
+        conferences, nextCursor = self._fetchPage(query, pageSize, cursor)
+        seats.loadSeats(conferences)
+
+        # need organiser displayName; served from the display name cache
+        names = self._getDisplayNames(conf.organizerUserId for conf in conferences)
 
         # return individual ConferenceForm object per Conference
         return ConferenceForms(
-                items=[self._copyConferenceToForm(conf, names[conf.organizerUserId]) for conf in \
-                conferences]
+                items=[self._copyConferenceToForm(conf, names.get(conf.organizerUserId)) \
+                for conf in conferences],
+                nextCursor=nextCursor
         )
 
 
@@ -385,6 +623,11 @@ class ConferenceApi(remote.Service):
                     setattr(pf, field.name, getattr(TeeShirtSize, getattr(prof, field.name)))
                 else:
                     setattr(pf, field.name, getattr(prof, field.name))
+        # registrations are Registration children of the Profile
+        pf.conferenceKeysToAttend = [key.id() for key in
+            Registration.query(ancestor=prof.key).iter(keys_only=True)]
+        pf.sessionWishListKeys = [key.id() for key in
+            WishlistEntry.query(ancestor=prof.key).iter(keys_only=True)]
         pf.check_initialized()
         return pf
 
@@ -409,10 +652,43 @@ class ConferenceApi(remote.Service):
                 teeShirtSize = str(TeeShirtSize.NOT_SPECIFIED),
             )
             profile.put()
+            self._displayNameChanged(profile)
+        elif profile.conferenceKeysToAttend or profile.sessionWishListKeys:
+            profile = self._migrateProfile(p_key)
 
         return profile      # return Profile
 
 
+    @staticmethod
+    def _migrateProfile(p_key):
+        """Move a Profile's legacy conferenceKeysToAttend and
+        sessionWishListKeys lists onto Registration and WishlistEntry
+        children; seats were already taken.  Return the Profile.
+        """
+        # wishlisted sessions live in other entity groups; read them outside
+        # the transaction, which then only touches the Profile's group
+        prof = p_key.get()
+        s_keys = [ndb.Key(urlsafe=wssk) for wssk in set(filter(None, prof.sessionWishListKeys))]
+        sessions = [sess for sess in ndb.get_multi(s_keys) if sess]
+        return ConferenceApi._storeMigratedProfile(p_key, sessions)
+
+
+    @staticmethod
+    @ndb.transactional()
+    def _storeMigratedProfile(p_key, sessions):
+        """Transaction behind _migrateProfile."""
+        prof = p_key.get()
+        if prof.conferenceKeysToAttend or prof.sessionWishListKeys:
+            c_keys = [ndb.Key(urlsafe=wsck) for wsck in set(prof.conferenceKeysToAttend)]
+            prof.conferenceKeysToAttend = []
+            prof.sessionWishListKeys = []
+            ndb.put_multi([prof] + [Registration(
+                key=Registration.keyFor(p_key, c_key), conference=c_key)
+                for c_key in c_keys] + [ConferenceApi._wishlistEntry(p_key, sess)
+                for sess in sessions])
+        return prof
+
+
     def _doProfile(self, save_request=None):
         """Get user Profile and return to user, possibly updating it first."""
         # get user Profile
@@ -420,6 +696,7 @@ class ConferenceApi(remote.Service):
 
         # if saveProfile(), process user-modifyable fields
         if save_request:
+            changed = False
             for field in ('displayName', 'teeShirtSize'):
                 if hasattr(save_request, field):
                     val = getattr(save_request, field)
@@ -429,67 +706,333 @@ class ConferenceApi(remote.Service):
                         #    setattr(prof, field, str(val).upper())
                         #else:
                         #    setattr(prof, field, val)
-                        prof.put()
+                        changed = True
+            if changed:
+                prof.put()
+                self._displayNameChanged(prof)
 
         # return ProfileForm
         return self._copyProfileToForm(prof)
 
 
-    @endpoints.method(message_types.VoidMessage, ProfileForm,
+    @instrument.method(message_types.VoidMessage, ProfileForm,
             path='profile', http_method='GET', name='getProfile')
     def getProfile(self, request):
         """Return user profile."""
         return self._doProfile()
 
 
-    @endpoints.method(ProfileMiniForm, ProfileForm,
+    @instrument.method(ProfileMiniForm, ProfileForm,
             path='profile', http_method='POST', name='saveProfile')
     def saveProfile(self, request):
         """Update & return user profile."""
         return self._doProfile(request)
 
 
+# - - - Cached reads - - - - - - - - - - - - - - - - - - - - -
+
+    @staticmethod
+    def _confCacheName(c_key):
+        """Cache generation name of a conference's ConferenceForm."""
+        return 'conf:' + c_key.urlsafe()
+
+
+    @staticmethod
+    def _sessionsCacheName(c_key):
+        """Cache generation name of a conference's SessionForms."""
+        return 'sessions:' + c_key.urlsafe()
+
+
+    def _ifNoneMatch(self, request):
+        """Return the client's ETags, from the ifNoneMatch field or else
+        the If-None-Match header.
+        """
+        state = getattr(self, 'request_state', None)
+        headers = getattr(state, 'headers', None)
+        return request.ifNoneMatch or (headers.get('If-None-Match') if headers else None)
+
+
+    def _readVersioned(self, request, name, messageType, read):
+        """Return message read(generation) of the generation of name with
+        its ETag, or just notModified if the client holds that ETag.
+        """
+        # an unchanged resource costs one memcache get and no serialization
+        generation = cache.getGeneration(name)
+        etag = cache.etagFor(generation)
+        if cache.etagMatches(self._ifNoneMatch(request), etag):
+            message = messageType(notModified=True)
+        else:
+            message = read(generation)
+        message.etag = etag
+        return message
+
+
+# - - - Organizer display names - - - - - - - - - - - - - - -
+
+    @staticmethod
+    def _cacheDisplayName(userId, displayName):
+        """Set organizer display name in memcache."""
+        memcache.set(MEMCACHE_DISPLAY_NAME_PREFIX + userId, displayName or "",
+            time=DISPLAY_NAME_TTL)
+
+
+    @staticmethod
+    def _getDisplayNames(userIds):
+        """Return dict of display names per user ID; memcache first,
+        then a single get_multi on Profile for any misses.
+        """
+        return ConferenceApi._getDisplayNamesAsync(userIds).get_result()
+
+
+    @staticmethod
+    @ndb.tasklet
+    def _getDisplayNamesAsync(userIds):
+        """Tasklet version of _getDisplayNames()."""
+        ctx = ndb.get_context()
+        userIds = list(set(userIds))
+        # concurrent memcache_get calls are batched into one memcache RPC
+        cached = yield [ctx.memcache_get(MEMCACHE_DISPLAY_NAME_PREFIX + userId)
+                        for userId in userIds]
+        names = dict((userId, name) for userId, name in zip(userIds, cached)
+                     if name is not None)
+        missing = [userId for userId in userIds if userId not in names]
+        if missing:
+            profiles = yield ndb.get_multi_async(
+                [ndb.Key(Profile, userId) for userId in missing])
+            # only existing profiles are cached: one created later must not
+            # show a blank organizer until the entry expires
+            fetched = {}
+            for userId, profile in zip(missing, profiles):
+                if profile:
+                    fetched[userId] = profile.displayName or ""
+                else:
+                    names[userId] = ""
+            yield [ctx.memcache_set(MEMCACHE_DISPLAY_NAME_PREFIX + userId, name,
+                                    time=DISPLAY_NAME_TTL)
+                   for userId, name in fetched.iteritems()]
+            names.update(fetched)
+        raise ndb.Return(names)
+
+
+    @staticmethod
+    def _displayNameChanged(prof):
+        """Keep organizer display names served to conference lists current
+        after a Profile is created or renamed.
+        """
+        ConferenceApi._cacheDisplayName(prof.key.id(), prof.displayName)
+        c_keys = Conference.query(ancestor=prof.key).fetch(keys_only=True)
+        for c_key in c_keys:
+            cache.bumpGeneration(ConferenceApi._confCacheName(c_key))
+        if c_keys:
+            cache.bumpGeneration(CONFERENCES_GENERATION)
+
+
+    def _getDisplayName(self, userId):
+        """Return display name of a single organizer."""
+        return self._getDisplayNames([userId]).get(userId)
+
+
 # - - - Announcements - - - - - - - - - - - - - - - - - - - -
 
     @staticmethod
     def _cacheAnnouncement():
-        """Create Announcement & assign to memcache; used by
-        memcache cron job & putAnnouncement().
+        """Rebuild nearly sold out conferences from a query & assign the
+        Announcement to memcache; used by the reconciliation cron job.
         """
         confs = Conference.query(ndb.AND(
-            Conference.seatsAvailable <= 5,
+            Conference.seatsAvailable <= NEARLY_SOLD_OUT_SEATS,
             Conference.seatsAvailable > 0)
         ).fetch(projection=[Conference.name])
 
-        if confs:
-            # If there are almost sold out conferences,
-            # format announcement and set it in memcache
-            announcement = ANNOUNCEMENT_TPL % (
-                ', '.join(conf.name for conf in confs))
-            memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
+        NearlySoldOut(key=ndb.Key(NearlySoldOut, 1), conferenceNames=dict(
+            (conf.key.urlsafe(), conf.name) for conf in confs)).put()
+        return ConferenceApi._setAnnouncement(conf.name for conf in confs)
+
+
+    @staticmethod
+    def _setAnnouncement(names):
+        """Format Announcement for conference names & assign to memcache."""
+        names = sorted(names)
+        if names:
+            # If there are almost sold out conferences, format announcement
+            announcement = ANNOUNCEMENT_TPL % ', '.join(names)
         else:
-            # If there are no sold out conferences,
-            # delete the memcache announcements entry
+            # If there are no sold out conferences, cache the empty
+            # announcement so getAnnouncement() still hits memcache
             announcement = ""
-            memcache.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
+        # store before bumping so a new ETag never pairs with an old text
+        changed = memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY) != announcement
+        memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
+        if changed:
+            cache.bumpGeneration(ANNOUNCEMENT_GENERATION)
+        return announcement
+
 
+    @staticmethod
+    def _isNearlySoldOut(seatsAvailable):
+        return 0 < (seatsAvailable or 0) <= NEARLY_SOLD_OUT_SEATS
+
+
+    @staticmethod
+    @ndb.transactional()
+    def _setNearlySoldOut(conf, nearlySoldOut):
+        """Add conference to or remove it from the nearly sold out set."""
+        nso = ndb.Key(NearlySoldOut, 1).get() or NearlySoldOut(key=ndb.Key(NearlySoldOut, 1))
+        names = dict(nso.conferenceNames or {})
+        wsck = conf.key.urlsafe()
+        if nearlySoldOut:
+            if names.get(wsck) == conf.name:
+                return
+            names[wsck] = conf.name
+        else:
+            if wsck not in names:
+                return
+            del names[wsck]
+        nso.conferenceNames = names
+        nso.put()
+        ndb.get_context().call_on_commit(
+            lambda: ConferenceApi._setAnnouncement(names.values()))
+
+
+    @staticmethod
+    def _onSeatsChanged(conf, before, after):
+        """Update state derived from a conference's available seats;
+        before is None for a new conference.
+        """
+        # only conferences crossing the threshold touch the announcement
+        if ConferenceApi._isNearlySoldOut(before) or ConferenceApi._isNearlySoldOut(after):
+            ConferenceApi._setNearlySoldOut(conf, ConferenceApi._isNearlySoldOut(after))
+        # and only those changing bucket touch the seats facet
+        buckets = [ConferenceApi._seatsBucket(seats) for seats in (before, after)]
+        if before is None or buckets[0] != buckets[1]:
+            ConferenceApi._changeFacets(
+                set([('seats', buckets[0])]) if before is not None else set(),
+                set([('seats', buckets[1])]))
+
+
+    @staticmethod
+    def _getAnnouncement():
+        """Return Announcement from memcache."""
+        announcement = memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY)
+        if announcement is None:
+            # evicted: rebuild from the stored nearly sold out set
+            nso = ndb.Key(NearlySoldOut, 1).get()
+            announcement = ConferenceApi._setAnnouncement(
+                nso.conferenceNames.values() if nso and nso.conferenceNames else [])
         return announcement
 
 
-    @endpoints.method(message_types.VoidMessage, StringMessage,
+    @instrument.method(ANNOUNCEMENT_GET_REQUEST, AnnouncementForm,
             path='conference/announcement/get',
             http_method='GET', name='getAnnouncement')
     def getAnnouncement(self, request):
-        """Return Announcement from memcache."""
-        return StringMessage(data=memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY) or "")
+        """Return Announcement, or notModified if ifNoneMatch is current."""
+        return self._readVersioned(request, ANNOUNCEMENT_GENERATION, AnnouncementForm,
+            lambda generation: AnnouncementForm(data=self._getAnnouncement()))
+
+
+# - - - Facets - - - - - - - - - - - - - - - - - - - - - - - -
+
+    @staticmethod
+    def _conferenceFacets(conf):
+        """Return the (facet, value) pairs of a conference, seats aside."""
+        facets = set(('topic', topic) for topic in conf.topics)
+        if conf.city:
+            facets.add(('city', conf.city))
+        if conf.month:
+            facets.add(('month', str(conf.month)))
+        return facets
+
+
+    @staticmethod
+    def _seatsBucket(seatsAvailable):
+        """Return the seats facet value for a number of available seats."""
+        if not seatsAvailable or seatsAvailable <= 0:
+            return 'SOLD_OUT'
+        if seatsAvailable <= NEARLY_SOLD_OUT_SEATS:
+            return 'NEARLY_SOLD_OUT'
+        return 'AVAILABLE'
+
+
+    @staticmethod
+    def _changeFacets(removed, added):
+        """Count one conference under the added (facet, value) pairs
+        instead of the removed ones; inside a transaction the counts
+        change once it commits.
+        """
+        removed, added = removed - added, added - removed
+        if not removed and not added:
+            return
+        deltas = [(pair, -1) for pair in removed] + [(pair, 1) for pair in added]
+        if ndb.in_transaction():
+            ndb.get_context().call_on_commit(
+                lambda: ConferenceApi._addFacetDeltas(random.choice(FACET_KEYS), deltas))
+        else:
+            ConferenceApi._addFacetDeltas(random.choice(FACET_KEYS), deltas)
+
+
+    @staticmethod
+    @ndb.transactional()
+    def _addFacetDeltas(key, deltas):
+        """Add ((facet, value), delta) pairs to one ConferenceFacets shard.
+        A shard's counts may be negative; only their sum is meaningful.
+        """
+        shard = key.get() or ConferenceFacets(key=key, counts={})
+        counts = shard.counts
+        for (facet, value), delta in deltas:
+            values = counts.setdefault(facet, {})
+            values[value] = values.get(value, 0) + delta
+            if not values[value]:
+                del values[value]
+        shard.put()
+        cache.bumpGenerationOnCommit('facets')
+
+
+    @staticmethod
+    def _rebuildFacets():
+        """Recount every conference's facets; used to repair the counts."""
+        counts = dict((facet, {}) for facet in FACET_FIELDS)
+        for conf in Conference.query().iter(batch_size=500):
+            pairs = ConferenceApi._conferenceFacets(conf)
+            pairs.add(('seats', ConferenceApi._seatsBucket(conf.seatsAvailable)))
+            for facet, value in pairs:
+                counts[facet][value] = counts[facet].get(value, 0) + 1
+        # the whole count goes on the first shard, the others restart empty
+        ndb.put_multi([ConferenceFacets(key=key, counts=counts if i == 0 else {})
+                       for i, key in enumerate(FACET_KEYS)])
+        cache.bumpGeneration('facets')
+
+
+    def _loadFacets(self):
+        """Return ConferenceFacetsForm of the facet counts summed over shards."""
+        counts = {}
+        for shard in ndb.get_multi(FACET_KEYS):
+            for facet, values in ((shard and shard.counts) or {}).iteritems():
+                total = counts.setdefault(facet, {})
+                for value, count in values.iteritems():
+                    total[value] = total.get(value, 0) + count
+        form = ConferenceFacetsForm()
+        for facet, field in FACET_FIELDS.iteritems():
+            values = counts.get(facet, {})
+            setattr(form, field, [FacetCountForm(value=value, count=count)
+                for value, count in sorted(values.iteritems(),
+                                           key=lambda item: (-item[1], item[0]))
+                if count > 0])
+        return form
+
+
+    @instrument.method(message_types.VoidMessage, ConferenceFacetsForm,
+            path='conference/facets',
+            http_method='GET', name='getConferenceFacets')
+    def getConferenceFacets(self, request):
+        """Return conference counts per city, topic, month and seats left."""
+        return cache.readThrough('facets', ConferenceFacetsForm, self._loadFacets)
 
 
 # - - - Registration - - - - - - - - - - - - - - - - - - - -
 
-    @ndb.transactional(xg=True)
     def _conferenceRegistration(self, request, reg=True):
         """Register or unregister user for selected conference."""
-        retval = None
         prof = self._getProfileFromUser() # get user Profile
 
         # check if conf exists given websafeConfKey
@@ -499,67 +1042,162 @@ class ConferenceApi(remote.Service):
         if not conf:
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % wsck)
+        if not conf.seatShards:
+            conf = seats.shardConference(conf.key)
+
+        # check if user already registered
+        r_key = Registration.keyFor(prof.key, conf.key)
+        if reg and r_key.get():
+            raise ConflictException(
+                "You have already registered for this conference")
+
+        # take a seat from a shard that appears to have one, trying them in
+        # random order so concurrent registrations hit different entity
+        # groups; a returned seat can go to any shard
+        shards = [shard for shard in ndb.get_multi(seats.shardKeys(conf)) if shard]
+        if reg:
+            shards = [shard for shard in shards if shard.seatsAvailable > 0]
+            random.shuffle(shards)
+        else:
+            shards = random.sample(shards, 1)
+        for shard in shards:
+            retval = self._moveSeat(r_key, shard.key, reg)
+            if retval is not None:
+                break
+        else:
+            raise ConflictException(
+                "There are no seats available.")
+
+        if retval:
+            seats.scheduleSync(conf.key)
+            cache.bumpGeneration(self._confCacheName(conf.key))
+            self._expireQuerySeats()
+        return BooleanMessage(data=retval)
+
+
+    @staticmethod
+    def _expireQuerySeats():
+        """Drop cached queryConferences pages after a registration, at
+        most once per QUERY_SEATS_STALENESS seconds; the pages themselves
+        expire after that long, so no seat count is staler than that.
+        """
+        if not QUERY_SEATS_STALENESS or memcache.add(
+                MEMCACHE_QUERY_SEATS_KEY, 1, time=QUERY_SEATS_STALENESS):
+            cache.bumpGeneration(CONFERENCES_GENERATION)
+
+
+    @ndb.transactional(xg=True)
+    def _moveSeat(self, r_key, s_key, reg):
+        """Move one seat between a seat shard and the user's Registration;
+        return None if the shard has no seat left to give.
+        """
+        registration, shard = ndb.get_multi([r_key, s_key])
 
         # register
         if reg:
             # check if user already registered otherwise add
-            if wsck in prof.conferenceKeysToAttend:
+            if registration:
                 raise ConflictException(
                     "You have already registered for this conference")
 
-            # check if seats avail
-            if conf.seatsAvailable <= 0:
-                raise ConflictException(
-                    "There are no seats available.")
+            # check if seats avail in this shard
+            if shard.seatsAvailable <= 0:
+                return None
 
             # register user, take away one seat
-            prof.conferenceKeysToAttend.append(wsck)
-            conf.seatsAvailable -= 1
-            retval = True
+            shard.seatsAvailable -= 1
+            ndb.put_multi([Registration(key=r_key,
+                conference=ndb.Key(urlsafe=r_key.id())), shard])
 
         # unregister
         else:
             # check if user already registered
-            if wsck in prof.conferenceKeysToAttend:
+            if not registration:
+                return False
 
-                # unregister user, add back one seat
-                prof.conferenceKeysToAttend.remove(wsck)
-                conf.seatsAvailable += 1
-                retval = True
-            else:
-                retval = False
+            # unregister user, add back one seat
+            shard.seatsAvailable += 1
+            r_key.delete()
+            shard.put()
 
-        # write things back to the datastore & return
-        prof.put()
-        conf.put()
-        return BooleanMessage(data=retval)
+        return True
 
 
-    @endpoints.method(message_types.VoidMessage, ConferenceForms,
+    @instrument.method(RPC_PAGE_GET_REQUEST, ConferenceForms,
             path='conferences/attending',
             http_method='GET', name='getConferencesToAttend')
     def getConferencesToAttend(self, request):
-        """Get list of conferences that user has registered for."""
+        """Get a page of conferences that user has registered for."""
+        with rpcstats.counting() as counts:
+            forms = self._getConferencesToAttendAsync(
+                request.pageSize, request.cursor).get_result()
+        if request.reportRpcs:
+            forms.rpcCount = counts['rpcs']
+        return forms
+
+
+    @ndb.tasklet
+    def _getConferencesToAttendAsync(self, pageSize=None, cursor=None):
+        """Tasklet behind getConferencesToAttend."""
         prof = self._getProfileFromUser() # get user Profile
-        conf_keys = [ndb.Key(urlsafe=wsck) for wsck in prof.conferenceKeysToAttend]
-        conferences = ndb.get_multi(conf_keys)
+        pageSize, cursor = self._pageArgs(pageSize, cursor)
+        r_keys, next_cursor, more = yield Registration.query(ancestor=prof.key)\
+            .fetch_page_async(pageSize, start_cursor=cursor, keys_only=True)
+        conf_keys = [ndb.Key(urlsafe=r_key.id()) for r_key in r_keys]
+        forms = yield self._conferenceFormsAsync(conf_keys)
+        raise ndb.Return(ConferenceForms(items=forms,
+            nextCursor=next_cursor.urlsafe() if more and next_cursor else None,
+        ))
+
+
+    @ndb.tasklet
+    def _conferenceFormsAsync(self, conf_keys):
+        """Return ConferenceForms of the existing Conferences in conf_keys."""
+        # organizers are the Conferences' parents and seat shard keys derive
+        # from Conference keys, so conferences, organizers' display names
+        # and seats are all fetched concurrently
+        conferences, names, _ = yield (ndb.get_multi_async(conf_keys),
+            self._getDisplayNamesAsync(key.parent().id() for key in conf_keys),
+            seats.prefetchShardsAsync(conf_keys))
+        yield seats.loadSeatsAsync(conferences)
 
-        # get organizers
-        organisers = [ndb.Key(Profile, conf.organizerUserId) for conf in conferences]
-        profiles = ndb.get_multi(organisers)
+        # return set of ConferenceForm objects per Conference
+        raise ndb.Return([self._copyConferenceToForm(conf, names.get(conf.organizerUserId))\
+         for conf in conferences if conf])
 
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
 
-        # return set of ConferenceForm objects per Conference
-        return ConferenceForms(items=[self._copyConferenceToForm(conf, names[conf.organizerUserId])\
-         for conf in conferences]
-        )
+    @instrument.method(CONF_PAGE_GET_REQUEST, AttendeeForms,
+            path='conference/{websafeConferenceKey}/attendees',
+            http_method='GET', name='getConferenceAttendees')
+    def getConferenceAttendees(self, request):
+        """Return a page of a conference's attendees (organizer only)."""
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        c_key = ndb.Key(urlsafe=request.websafeConferenceKey)
+        # read the conference while the user id resolves
+        confFuture = c_key.get_async()
+        user_id = getUserIdAsync(user).get_result()
+        conf = confFuture.get_result()
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % request.websafeConferenceKey)
+        if user_id != conf.organizerUserId:
+            raise endpoints.ForbiddenException(
+                'Only the owner can see the attendees.')
+
+        r_keys, nextCursor = self._fetchPage(
+            Registration.query(Registration.conference == c_key),
+            request.pageSize, request.cursor, keys_only=True)
+        profiles = ndb.get_multi([r_key.parent() for r_key in r_keys])
+        return AttendeeForms(items=[AttendeeForm(
+                displayName=prof.displayName, mainEmail=prof.mainEmail,
+                teeShirtSize=getattr(TeeShirtSize, prof.teeShirtSize))
+            for prof in profiles if prof],
+            nextCursor=nextCursor)
 
 
-    @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
+    @instrument.method(CONF_GET_REQUEST, BooleanMessage,
             path='conference/{websafeConferenceKey}',
             http_method='POST', name='registerForConference')
     def registerForConference(self, request):
@@ -567,7 +1205,7 @@ class ConferenceApi(remote.Service):
         return self._conferenceRegistration(request)
 
 
-    @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
+    @instrument.method(CONF_GET_REQUEST, BooleanMessage,
             path='conference/{websafeConferenceKey}',
             http_method='DELETE', name='unregisterFromConference')
     def unregisterFromConference(self, request):
@@ -575,7 +1213,7 @@ class ConferenceApi(remote.Service):
         return self._conferenceRegistration(request, reg=False)
 
 
-    @endpoints.method(message_types.VoidMessage, ConferenceForms,
+    @instrument.method(message_types.VoidMessage, ConferenceForms,
             path='filterPlayground',
             http_method='GET', name='filterPlayground')
     def filterPlayground(self, request):
@@ -598,19 +1236,59 @@ class ConferenceApi(remote.Service):
 
     def _createSessionObject(self, request):
         """Create or update Session object, returning SessionForm/request."""
+        conf = self._getOwnedConference(request.websafeConferenceKey)
+        sess = self._sessionFromForm(request, conf.key)
+
+        # Generate Session Key from obtained Conference key
+        s_id = Session.allocate_ids(size=1, parent=conf.key)[0]
+        sess.key = ndb.Key(Session, s_id, parent=conf.key)
+
+        # Create Session 
+        self._putSessions([sess])
+        cache.bumpGeneration(self._sessionsCacheName(conf.key))
+        searchindex.indexSessions([sess])
+
+        # Determine featured speaker; bursts of sessions share one task
+        self._scheduleFeaturedSpeaker(conf.key)
+
+        # Return SessionForm of the stored Session
+        return self._copySessionToForm(sess)
+
+    def _createSessionObjects(self, request):
+        """Create Sessions from request.items in bulk, returning SessionForms."""
+        conf = self._getOwnedConference(request.websafeConferenceKey)
+        if not request.items:
+            return SessionForms(items=[])
+        if len(request.items) > MAX_BULK_SESSIONS:
+            raise endpoints.BadRequestException(
+                'At most %d sessions per request' % MAX_BULK_SESSIONS)
+        sessions = [self._sessionFromForm(form, conf.key)
+                    for form in request.items]
+
+        # One id allocation for the whole batch
+        first, last = Session.allocate_ids(size=len(sessions), parent=conf.key)
+        for s_id, sess in zip(range(first, last + 1), sessions):
+            sess.key = ndb.Key(Session, s_id, parent=conf.key)
+
+        for batch in self._sessionBatches(sessions):
+            self._putSessions(batch)
+        cache.bumpGeneration(self._sessionsCacheName(conf.key))
+        searchindex.indexSessions(sessions)
+        self._scheduleFeaturedSpeaker(conf.key)
+
+        return SessionForms(
+            items=[self._copySessionToForm(sess) for sess in sessions])
+
+    def _getOwnedConference(self, websck):
+        """Return the Conference for websck if the current user owns it."""
         # Check if user is authorized
         user = endpoints.get_current_user()
         if not user:
             raise endpoints.UnauthorizedException('Authorization required')
-        user_id = getUserId(user)
-
-        # Check if required Form fields have been filled
-        if not request.name:
-            raise endpoints.BadRequestException("Session 'name' field required")
-
-        # Retrieve the conference Key and check if it exists
-        websck = request.websafeConferenceKey
-        conf = ndb.Key(urlsafe=websck).get()
+        # Retrieve the conference while the user id resolves; check it exists
+        confFuture = ndb.Key(urlsafe=websck).get_async()
+        user_id = getUserIdAsync(user).get_result()
+        conf = confFuture.get_result()
         if not conf:
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % websck)
@@ -619,10 +1297,17 @@ class ConferenceApi(remote.Service):
         if user_id != conf.organizerUserId:
             raise endpoints.ForbiddenException(
                 'Only the owner can update the conference.')
+        return conf
+
+    def _sessionFromForm(self, form, c_key):
+        """Return an unkeyed Session of Conference c_key built from form."""
+        # Check if required Form fields have been filled
+        if not form.name:
+            raise endpoints.BadRequestException("Session 'name' field required")
 
         # Copy SessionForm/ProtoRPC Message into dict
-        data = {field.name: getattr(request, field.name) for field in request.all_fields()}
-        sess = self._copySessionToForm(request)
+        data = {field.name: getattr(form, field.name)
+                for field in SessionForm.all_fields()}
         del data['websafeConferenceKey']
         del data['websafeSessionKey']
 
@@ -630,9 +1315,9 @@ class ConferenceApi(remote.Service):
         for df in SESSION_DEFAULTS:
             if data[df] in (None, []):
                 data[df] = SESSION_DEFAULTS[df]
-                setattr(request, df, SESSION_DEFAULTS[df])
+                setattr(form, df, SESSION_DEFAULTS[df])
 
-        # Convert dates and times from strings to Date and Time objects; set month based on start_date
+        # Convert dates and times from strings to Date and Time objects
         if data['date']:
             data['date'] = datetime.strptime(data['date'][:10], "%Y-%m-%d").date()
 
@@ -642,101 +1327,184 @@ class ConferenceApi(remote.Service):
         if data['startTime']:
             data['startTime'] = datetime.strptime(data['startTime'][:5], "%H:%M").time()
 
+        return Session(**data)
 
-        # Generate Session Key from obtained Conference key
-        s_id = Session.allocate_ids(size=1, parent=ndb.Key(urlsafe=request.websafeConferenceKey))[0]
-        s_key = ndb.Key(Session, s_id, parent=ndb.Key(urlsafe=request.websafeConferenceKey))
-        data['key'] = s_key
+    @staticmethod
+    def _sessionBatches(sessions):
+        """Split sessions of one conference into put batches whose
+        transactions stay within the cross-group limit: the conference
+        group plus one Speaker group per distinct speaker.
+        """
+        batch, speakers = [], set()
+        for sess in sessions:
+            newSpeaker = sess.speakerId and sess.speakerId not in speakers
+            if len(batch) == SESSION_BATCH_SIZE or \
+                    (newSpeaker and len(speakers) == MAX_BATCH_SPEAKERS):
+                yield batch
+                batch, speakers = [], set()
+            batch.append(sess)
+            if sess.speakerId:
+                speakers.add(sess.speakerId)
+        if batch:
+            yield batch
 
-        # Create Session 
-        Session(**data).put()
+    @staticmethod
+    @ndb.transactional(xg=True)
+    def _putSessions(sessions):
+        """Store Sessions of one conference and count them on their Speaker
+        index entities and on the per-conference ConferenceSpeaker aggregates.
+        """
+        c_key = sessions[0].key.parent()
+        bySpeaker = {}
+        for sess in sessions:
+            if sess.speakerId:
+                bySpeaker.setdefault(sess.speakerId, []).append(sess)
+        speakerIds = list(bySpeaker)
+        sp_keys = [ndb.Key(Speaker, sid) for sid in speakerIds]
+        cs_keys = [ndb.Key(ConferenceSpeaker, sid, parent=c_key)
+                   for sid in speakerIds]
+        found = ndb.get_multi(sp_keys + cs_keys)
+
+        entities = list(sessions)
+        for i, sid in enumerate(speakerIds):
+            speakerSessions = bySpeaker[sid]
+            name = speakerSessions[0].speaker
+            confSpeaker = found[len(speakerIds) + i] or \
+                ConferenceSpeaker(key=cs_keys[i], name=name)
+            confSpeaker.sessionCount += len(speakerSessions)
+            confSpeaker.sessionNames.extend(s.name for s in speakerSessions)
+            entities.append(confSpeaker)
+            if sid != DEFAULT_SPEAKER_ID:
+                speaker = found[i] or Speaker(key=sp_keys[i], name=name)
+                speaker.sessionCount += len(speakerSessions)
+                entities.append(speaker)
+        ndb.put_multi(entities)
 
-        # Add to task queue parameters needed to determine featured speaker
-        taskqueue.add(params={'speaker': data['speaker'], 'websafeConferenceKey': websck},
-            url='/tasks/determine_featured_speaker'
-        )
 
-        # Return (modified) SessionForm
-        return sess
+    @staticmethod
+    def _backfillSpeakers(sessions):
+        """Store speakerId on Sessions put before it existed and count them
+        on their Speaker and ConferenceSpeaker aggregates; sessions that
+        already have a stored speakerId are skipped, so reruns are safe.
+        """
+        # a computed property read back from the datastore is only in
+        # _values if it was stored
+        byConference = {}
+        for sess in sessions:
+            if 'speakerId' not in sess._values:
+                byConference.setdefault(sess.key.parent(), []).append(sess)
+        for c_key, confSessions in byConference.iteritems():
+            for batch in ConferenceApi._sessionBatches(confSessions):
+                ConferenceApi._putSessions(batch)
+            cache.bumpGeneration(ConferenceApi._sessionsCacheName(c_key))
+            ConferenceApi._scheduleFeaturedSpeaker(c_key)
+        return sum(len(confSessions) for confSessions in byConference.itervalues())
+
+
+    @staticmethod
+    def _backfillSessionTimes(sessions):
+        """Store startMinute, endMinute and timeSlots on Sessions put before
+        they existed, so that window and conflict queries find them; return
+        how many were put. Reruns skip the sessions already stored.
+        """
+        # an empty timeSlots is never stored, so look at the minutes
+        stale = [sess for sess in sessions
+                 if 'startMinute' not in sess._values or
+                 'endMinute' not in sess._values]
+        ndb.put_multi(stale)
+        return len(stale)
+
 
     def _copySessionToForm(self, sess):
-        """Copy relevant fields from Conference to ConferenceForm."""
-        se = SessionForm()
-        for field in se.all_fields():
-            if hasattr(sess, field.name):
-                # Convert date, time and duration to strings; just copy others
-                if field.name.endswith('date'):
-                    setattr(se, field.name, str(getattr(sess, field.name)))
-                elif field.name.endswith('Time'):
-                    setattr(se, field.name, str(getattr(sess, field.name)))
-                elif field.name.endswith('duration'):
-                    setattr(se, field.name, str(getattr(sess, field.name)))
-                else:
-                    setattr(se, field.name, getattr(sess, field.name))
-            # Copy over the keys
-            elif field.name == "websafeConferenceKey":
-                setattr(se, field.name, sess.key.parent().urlsafe())
-            elif field.name == "websafeSessionKey":
-                setattr(se, field.name, sess.key.urlsafe())
-        se.check_initialized()
-        return se
+        """Copy relevant fields from Session to SessionForm."""
+        return SESSION_SERIALIZER.toForm(sess)
 
 
-    @endpoints.method(SESS_POST_REQUEST, SessionForm, path='conference/session/{websafeConferenceKey}',
+    @instrument.method(SESS_POST_REQUEST, SessionForm, path='conference/session/{websafeConferenceKey}',
             http_method='POST', name='createSession')
     def createSession(self, request):
         """Create new session."""
         return self._createSessionObject(request)
 
-    @endpoints.method(SESS_POST_REQUEST, SessionForms,
+    @instrument.method(SESS_BULK_POST_REQUEST, SessionForms,
+            path='conference/sessions/{websafeConferenceKey}',
+            http_method='POST', name='createSessions')
+    def createSessions(self, request):
+        """Create many sessions of one conference in one request."""
+        return self._createSessionObjects(request)
+
+    @instrument.method(SESS_LIST_POST_REQUEST, SessionForms,
             path='conference/session/getConferenceSessions/{websafeConferenceKey}',
             http_method='POST', name='getConferenceSessions')
     def getConferenceSessions(self, request):
-        """Return conference sessions."""
+        """Return conference sessions, or notModified if ifNoneMatch is current."""
+        c_key = ndb.Key(urlsafe=request.websafeConferenceKey)
+        name = self._sessionsCacheName(c_key)
+        return self._readVersioned(request, name, SessionForms,
+            lambda generation: cache.readThrough(name, SessionForms,
+                lambda: self._loadConferenceSessions(c_key), generation=generation))
+
+
+    def _loadConferenceSessions(self, c_key):
+        """Read conference sessions from datastore as SessionForms."""
         # Create ancestor query for all key matches for the conference key
-        allSessions = Session.query(ancestor=ndb.Key(urlsafe=request.websafeConferenceKey)).fetch()
+        allSessions = Session.query(ancestor=c_key).fetch()
         # Return set of SessionForm objects per Session
         return SessionForms(
             items=[self._copySessionToForm(sess) for sess in allSessions]
         )
 
-    @endpoints.method(SESS_TYPE_POST_REQUEST, SessionForms,
+    @instrument.method(SESS_TYPE_POST_REQUEST, SessionForms,
             path='conference/session/getConferenceSessionsByType/{websafeConferenceKey}/{typeOfSession}',
             http_method='POST', name='getConferenceSessionsByType')
     def getConferenceSessionsByType(self, request):
-        """Return conference sessions by type."""
-        # Create ancestor query for all key matches for the conference key
-        allSessions = Session.query(ancestor=ndb.Key(urlsafe=request.websafeConferenceKey)).fetch()
-        # Iterate through returned query to find all sessions of the same type
-        sessionTypeQuery=[]
-        for i in allSessions:
-            if i.typeOfSession == request.typeOfSession:
-                sessionTypeQuery.append(i)
+        """Return conference sessions by type; typeOfSession may list
+        several comma separated types, e.g. "keynote,workshop".
+        """
+        types = [t.strip() for t in request.typeOfSession.split(',') if t.strip()]
+        if not types:
+            raise endpoints.BadRequestException("'typeOfSession' field required")
+        # Ancestor query filtered on type by the datastore
+        q = Session.query(ancestor=ndb.Key(urlsafe=request.websafeConferenceKey))
+        q = q.filter(Session.typeOfSession.IN(types))
+        if request.orderByStartTime:
+            q = q.order(Session.startTime)
         # Return set of SessionForm objects per Session
         return SessionForms(
-            items=[self._copySessionToForm(sess) for sess in sessionTypeQuery]
+            items=[self._copySessionToForm(sess) for sess in q]
         )
 
 
-    @endpoints.method(SESS_SPEAKER_POST_REQUEST, SessionForms,
+    @instrument.method(SESS_SPEAKER_POST_REQUEST, SessionForms,
             path='conference/session/getSessionsBySpeaker/{speaker}',
             http_method='POST', name='getSessionsBySpeaker')
     def getSessionsBySpeaker(self, request):
-        """Return all sessions given by speaker, across all conferences."""
-        # Create query for all sessions across all conferences
-        allSessions = Session.query().fetch()
-        # Iterate through returned query to match all sessions of the requested type
-        sessionSpeakerQuery=[]
-        for i in allSessions:
-            if i.speaker == request.speaker:
-                sessionSpeakerQuery.append(i)
+        """Return sessions given by speaker across all conferences, paginated."""
+        # Indexed lookup on the normalized speaker name
+        q = Session.query(Session.speakerId == Speaker.normalize(request.speaker))
+        sessions, nextCursor = self._fetchPage(q, request.pageSize, request.cursor)
         # Return set of SessionForm objects per Session
         return SessionForms(
-            items=[self._copySessionToForm(sess) for sess in sessionSpeakerQuery]
+            items=[self._copySessionToForm(sess) for sess in sessions],
+            nextCursor=nextCursor
+        )
+
+
+    @instrument.method(PAGE_GET_REQUEST, SpeakerForms,
+            path='conference/session/speakers',
+            http_method='GET', name='getSpeakers')
+    def getSpeakers(self, request):
+        """Return speakers with their session counts, paginated by name."""
+        speakers, nextCursor = self._fetchPage(
+            Speaker.query().order(Speaker.name), request.pageSize, request.cursor)
+        return SpeakerForms(
+            items=[SpeakerForm(name=sp.name, sessionCount=sp.sessionCount)
+                   for sp in speakers],
+            nextCursor=nextCursor
         )
 
 
-    @endpoints.method(SESS_GET_REQUEST, BooleanMessage,
+    @instrument.method(SESS_GET_REQUEST, BooleanMessage,
             path='conference/session/addSessionToWishlist/{SessionKey}',
             http_method='POST', name='addSessionToWishlist')
     def addSessionToWishlist(self, request):
@@ -748,135 +1516,497 @@ class ConferenceApi(remote.Service):
         """Add session to wishlist for selected session."""
         # Get user Profile
         prof = self._getProfileFromUser()
-        # Check if session exists given conference key
+        # Check if session exists and if user already has it in wishlist
         sck = request.SessionKey
-        sess = ndb.Key(urlsafe=sck).get()
+        s_key = ndb.Key(urlsafe=sck)
+        sess, entry = ndb.get_multi([s_key, WishlistEntry.keyFor(prof.key, s_key)])
         if not sess:
             raise endpoints.NotFoundException(
                 'No session found with key: %s' % sck)
-
-        # Check if user already has session in wishlist
-        if sck in prof.sessionWishListKeys:
+        if entry:
             raise ConflictException(
                 "You have already added this session to your wishlist")
         # Add session to wish list
-        prof.sessionWishListKeys.append(sck)
-        # Write things back to the datastore & return
-        prof.put()
+        self._wishlistEntry(prof.key, sess).put()
         return BooleanMessage(data=True)
 
-    @endpoints.method(message_types.VoidMessage, SessionForms,
+
+    @staticmethod
+    def _wishlistEntry(p_key, sess):
+        """Return a new WishlistEntry of Profile p_key for a Session."""
+        return WishlistEntry(key=WishlistEntry.keyFor(p_key, sess.key),
+            conference=sess.key.parent(), session=sess.key,
+            timeSlots=sess.timeSlots)
+
+
+    def _wishlistKeys(self, request):
+        """Return (Profile key, Session keys) for a SessionKeysForm."""
+        if len(request.sessionKeys) > MAX_PAGE_SIZE:
+            raise endpoints.BadRequestException(
+                "At most %d sessionKeys per request." % MAX_PAGE_SIZE)
+        prof = self._getProfileFromUser()
+        return prof.key, [ndb.Key(urlsafe=sck) for sck in set(request.sessionKeys)]
+
+
+    def _removeFromWishlist(self, p_key, s_keys):
+        """Delete the Profile's wishlist entries for s_keys; only entries
+        that exist are written.  Return whether there were any.
+        """
+        e_keys = [WishlistEntry.keyFor(p_key, s_key) for s_key in s_keys]
+        stored = [entry.key for entry in ndb.get_multi(e_keys) if entry]
+        if stored:
+            ndb.delete_multi(stored)
+        return bool(stored)
+
+
+    @instrument.method(SessionKeysForm, BooleanMessage,
+            path='conferences/session/wishlist/add',
+            http_method='POST', name='addSessionsToWishlist')
+    def addSessionsToWishlist(self, request):
+        """Add sessions to user wishlist; return whether any was new."""
+        p_key, s_keys = self._wishlistKeys(request)
+        e_keys = [WishlistEntry.keyFor(p_key, s_key) for s_key in s_keys]
+        found = ndb.get_multi(s_keys + e_keys)
+        sessions, entries = found[:len(s_keys)], found[len(s_keys):]
+        missing = [s_key.urlsafe() for s_key, sess in zip(s_keys, sessions) if not sess]
+        if missing:
+            raise endpoints.NotFoundException(
+                'No session found with key: %s' % ', '.join(missing))
+        new = [self._wishlistEntry(p_key, sess)
+               for sess, entry in zip(sessions, entries) if not entry]
+        if new:
+            ndb.put_multi(new)
+        return BooleanMessage(data=bool(new))
+
+
+    @instrument.method(SessionKeysForm, BooleanMessage,
+            path='conferences/session/wishlist/remove',
+            http_method='POST', name='removeSessionsFromWishlist')
+    def removeSessionsFromWishlist(self, request):
+        """Remove sessions from user wishlist; return whether any was there."""
+        p_key, s_keys = self._wishlistKeys(request)
+        return BooleanMessage(data=self._removeFromWishlist(p_key, s_keys))
+
+
+    @instrument.method(RPC_PAGE_GET_REQUEST, SessionForms,
             path='conferences/session/wishlist',
             http_method='GET', name='getSessionsInWishlist')
     def getSessionsInWishlist(self, request):
-        """Get list of sessions that user has interested in."""
+        """Get a page of sessions that user has interested in."""
+        with rpcstats.counting() as counts:
+            groups, nextCursor = self._getWishlistPageAsync(
+                request.pageSize, request.cursor).get_result()
+        forms = SessionForms(items=[form for group in groups for form in group.items],
+            nextCursor=nextCursor)
+        if request.reportRpcs:
+            forms.rpcCount = counts['rpcs']
+        return forms
+
+
+    @instrument.method(RPC_PAGE_GET_REQUEST, WishlistForms,
+            path='conferences/session/wishlist/byConference',
+            http_method='GET', name='getWishlistByConference')
+    def getWishlistByConference(self, request):
+        """Get a page of the user's wishlist grouped by conference."""
+        with rpcstats.counting() as counts:
+            groups, nextCursor = self._getWishlistPageAsync(
+                request.pageSize, request.cursor).get_result()
+        forms = WishlistForms(groups=groups, nextCursor=nextCursor)
+        if request.reportRpcs:
+            forms.rpcCount = counts['rpcs']
+        return forms
+
+
+    @ndb.tasklet
+    def _getWishlistPageAsync(self, pageSize=None, cursor=None):
+        """Tasklet behind the wishlist reads; return (WishlistGroupForms,
+        next cursor) for one page of entries ordered by conference.
+        """
         # Get user Profile
         prof = self._getProfileFromUser()
-        # Remove any empty values in array to protect from type value error
-        prof.sessionWishListKeys = filter(None, prof.sessionWishListKeys)
-        # Retrieve wishlist session keys
-        sess_keys = [ndb.Key(urlsafe=wsck) for wsck in prof.sessionWishListKeys]
-        # Get sessions
-        sessions = ndb.get_multi(sess_keys)
-        # Return set of SessionForm objects per Session
-        return SessionForms(
-            items=[self._copySessionToForm(sess) for sess in sessions]
-        )
-
-    @endpoints.method(SESS_GET_REQUEST, BooleanMessage,
+        pageSize, cursor = self._pageArgs(pageSize, cursor)
+        entries, next_cursor, more = yield WishlistEntry.query(ancestor=prof.key)\
+            .order(WishlistEntry.conference)\
+            .fetch_page_async(pageSize, start_cursor=cursor)
+
+        # Get sessions and their conferences concurrently
+        c_keys = list(set(entry.conference for entry in entries))
+        sessions, conferences = yield (
+            ndb.get_multi_async([entry.session for entry in entries]),
+            ndb.get_multi_async(c_keys))
+        names = {conf.key: conf.name for conf in conferences if conf}
+
+        # Entries come ordered by conference, so each group is contiguous
+        groups = []
+        for entry, sess in zip(entries, sessions):
+            if not sess:
+                continue
+            wsck = entry.conference.urlsafe()
+            if not groups or groups[-1].websafeConferenceKey != wsck:
+                groups.append(WishlistGroupForm(websafeConferenceKey=wsck,
+                    conferenceName=names.get(entry.conference)))
+            groups[-1].items.append(self._copySessionToForm(sess))
+        raise ndb.Return((groups,
+            next_cursor.urlsafe() if more and next_cursor else None))
+
+
+    @instrument.method(SESS_GET_REQUEST, SessionForms,
+            path='conferences/session/wishlist/conflicts/{SessionKey}',
+            http_method='GET', name='getWishlistConflicts')
+    def getWishlistConflicts(self, request):
+        """Return the wishlisted sessions whose times overlap a session."""
+        prof = self._getProfileFromUser()
+        sck = request.SessionKey
+        sess = ndb.Key(urlsafe=sck).get()
+        if not sess:
+            raise endpoints.NotFoundException(
+                'No session found with key: %s' % sck)
+        span = sess.span()
+        if not span:
+            return SessionForms(items=[])
+
+        # entries sharing a time slot are candidates; check exact times.
+        # a user's wishlist is small, so all of them are read in batches
+        slots = Session.slotsFor(span)
+        e_keys = WishlistEntry.query(WishlistEntry.timeSlots >= slots[0],
+            WishlistEntry.timeSlots <= slots[-1], ancestor=prof.key)\
+            .fetch(keys_only=True, batch_size=MAX_PAGE_SIZE)
+        candidates = ndb.get_multi([ndb.Key(urlsafe=e_key.id())
+            for e_key in e_keys if e_key.id() != sck])
+        return SessionForms(items=[self._copySessionToForm(other)
+            for other in candidates if other and Session.overlaps(other.span(), span)])
+
+
+    @instrument.method(SESS_GET_REQUEST, BooleanMessage,
             path='conferences/session/wishlist/deleteSessionInWishlist/{SessionKey}',
             http_method='DELETE', name='deleteSessionInWishlist')
     def deleteSessionInWishlist(self, request):
-        """Get list of sessions that user has interested in."""
+        """Remove session from user wishlist."""
         # Get user Profile
         prof = self._getProfileFromUser()
-        # Get session key
-        wsck = request.SessionKey
-        # Remove any empty values in array to protect from type value error
-        if wsck in prof.sessionWishListKeys:
-            prof.sessionWishListKeys.remove(wsck)
-        # Write update back to datastore and return
-        prof.put()
+        # Delete the entry if there is one; nothing is written otherwise
+        self._removeFromWishlist(prof.key, [ndb.Key(urlsafe=request.SessionKey)])
         return BooleanMessage(data=True)
 
 
     @staticmethod
-    def _cacheSpeakerAnnouncement(speaker, sessions):
-        """Create Speaker Announcement & assign to memcache."""
-        if speaker:
+    def _scheduleFeaturedSpeaker(c_key):
+        """Enqueue one featured speaker recompute per conference per
+        FEATURED_SPEAKER_INTERVAL.
+        """
+        addCoalescedTask('featured-' + c_key.urlsafe(),
+            '/tasks/determine_featured_speaker',
+            {'websafeConferenceKey': c_key.urlsafe()}, FEATURED_SPEAKER_INTERVAL)
+
+
+    @staticmethod
+    def _cacheSpeakerAnnouncement(c_key):
+        """Create Speaker Announcement for a conference from its speaker
+        aggregates & assign to memcache.
+        """
+        # Speaker with the most sessions in the conference; featured if more than one
+        top = ConferenceSpeaker.query(ancestor=c_key).order(
+            -ConferenceSpeaker.sessionCount).get()
+        if top and top.sessionCount > 1:
             # If there is a featured speaker,
             # format announcement and set it in memcache
             speakerAnnouncement = SPEAKER_ANNOUNCEMENT_TPL % (
-                speaker, ', '.join(session.name for session in sessions))
-            memcache.set(MEMCACHE_SPEAKER_ANNOUNCEMENTS_KEY, speakerAnnouncement)
+                top.name, ', '.join(top.sessionNames))
+            announcements = {
+                MEMCACHE_SPEAKER_ANNOUNCEMENTS_KEY: speakerAnnouncement,
+                ConferenceApi._speakerAnnouncementKey(c_key): speakerAnnouncement,
+            }
         else:
-            # If there is no featured speaker,
-            # delete the memcache announcements entry
+            # If there is no featured speaker, cache the empty announcement
             speakerAnnouncement = ""
-            memcache.delete(MEMCACHE_SPEAKER_ANNOUNCEMENTS_KEY)
+            announcements = {
+                ConferenceApi._speakerAnnouncementKey(c_key): speakerAnnouncement,
+            }
+        # store before bumping so a new ETag never pairs with an old text
+        stored = memcache.get_multi(announcements.keys())
+        memcache.set_multi(announcements)
+        for key, announcement in announcements.iteritems():
+            if stored.get(key) != announcement:
+                cache.bumpGeneration(ConferenceApi._speakerCacheName(
+                    None if key == MEMCACHE_SPEAKER_ANNOUNCEMENTS_KEY else c_key))
         return speakerAnnouncement
 
 
-    @endpoints.method(message_types.VoidMessage, StringMessage,
+    @staticmethod
+    def _speakerAnnouncementKey(c_key):
+        return '%s:%s' % (MEMCACHE_SPEAKER_ANNOUNCEMENTS_KEY, c_key.urlsafe())
+
+
+    @staticmethod
+    def _speakerCacheName(c_key=None):
+        """Cache generation name of a conference's featured speaker, or
+        of the most recently featured speaker.
+        """
+        return 'speaker:' + c_key.urlsafe() if c_key else 'speaker'
+
+
+    def _getFeaturedSpeaker(self, c_key):
+        """Return featured speaker Announcement from memcache."""
+        if not c_key:
+            return memcache.get(MEMCACHE_SPEAKER_ANNOUNCEMENTS_KEY) or ""
+        announcement = memcache.get(self._speakerAnnouncementKey(c_key))
+        if announcement is None:
+            announcement = self._cacheSpeakerAnnouncement(c_key)
+        return announcement
+
+
+    @instrument.method(SPEAKER_ANNOUNCEMENT_GET_REQUEST, AnnouncementForm,
             path='conference/session/announcement/get',
             http_method='GET', name='getFeaturedSpeaker')
     def getFeaturedSpeaker(self, request):
-        """Return Announcement from memcache."""
-        return StringMessage(data=memcache.get(MEMCACHE_SPEAKER_ANNOUNCEMENTS_KEY))
+        """Return featured speaker Announcement, for the given conference or
+        else the most recently featured speaker; notModified if ifNoneMatch
+        is current.
+        """
+        c_key = (ndb.Key(urlsafe=request.websafeConferenceKey)
+                 if request.websafeConferenceKey else None)
+        return self._readVersioned(request, self._speakerCacheName(c_key),
+            AnnouncementForm,
+            lambda generation: AnnouncementForm(data=self._getFeaturedSpeaker(c_key)))
+
+
+# - - - Search - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def _searchKeys(self, request, indexName):
+        """Return (ranked entity keys, next cursor) for a search request."""
+        if not request.query:
+            raise endpoints.BadRequestException("Search 'query' field required")
+        pageSize = self._pageArgs(request.pageSize, None)[0]
+        try:
+            return searchindex.find(indexName, request.query, pageSize,
+                request.cursor)
+        except ValueError as e:
+            raise endpoints.BadRequestException(str(e))
+
+
+    @instrument.method(SEARCH_GET_REQUEST, ConferenceForms,
+            path='search/conferences',
+            http_method='GET', name='searchConferences')
+    def searchConferences(self, request):
+        """Search conference names, descriptions, topics and cities."""
+        keys, nextCursor = self._searchKeys(request, searchindex.CONFERENCE_INDEX)
+        return ConferenceForms(items=self._conferenceFormsAsync(keys).get_result(),
+            nextCursor=nextCursor)
+
+
+    @instrument.method(SEARCH_GET_REQUEST, SessionForms,
+            path='search/sessions',
+            http_method='GET', name='searchSessions')
+    def searchSessions(self, request):
+        """Search session names, highlights and speakers."""
+        keys, nextCursor = self._searchKeys(request, searchindex.SESSION_INDEX)
+        return SessionForms(items=[self._copySessionToForm(sess)
+            for sess in ndb.get_multi(keys) if sess], nextCursor=nextCursor)
+
+
+# - - - Session queries - - - - - - - - - - - - - - - - - - - -
+
+    def _formatSessionFilters(self, filters):
+        """Parse, check validity and type user supplied session filters."""
+        formatted_filters = []
+        for f in filters:
+            filtr = {field.name: getattr(f, field.name) for field in f.all_fields()}
+            try:
+                filtr["field"] = SESSION_FIELDS[filtr["field"]]
+                filtr["operator"] = OPERATORS[filtr["operator"]]
+            except KeyError:
+                raise endpoints.BadRequestException("Filter contains invalid field or operator.")
+            try:
+                filtr["value"] = self._parseSessionValue(filtr["field"], filtr["value"])
+            except (TypeError, ValueError):
+                raise endpoints.BadRequestException(
+                    "Invalid value for %s filter: %s" % (filtr["field"], filtr["value"]))
+            formatted_filters.append(filtr)
+        return formatted_filters
+
+
+    @staticmethod
+    def _parseSessionValue(field, value):
+        """Convert filter value string to the Session property's type."""
+        if field == 'date':
+            return datetime.strptime(value[:10], "%Y-%m-%d").date()
+        if field == 'startTime':
+            return datetime.strptime(value[:5], "%H:%M").time()
+        if field == 'speakerId':
+            return Speaker.normalize(value)
+        return value
+
+
+    def _planSessionQuery(self, filters):
+        """Return (datastore query, residual filters) for session filters.
+
+        Equality filters always go to the datastore, the most selective
+        part of any query. The datastore allows range filters on one
+        property only, and only where an index covers it together with the
+        equalities, so of the properties SESSION_RANGE_INDEXES allows the
+        one bounded on both sides is pushed down (ties follow
+        SESSION_RANGE_FIELDS). Every other filter, including all "!="
+        filters, is residual.
+        """
+        equalities = set(f["field"] for f in filters if f["operator"] == "=")
+        bounds = {}
+        for filtr in filters:
+            if filtr["operator"] not in ("=", "!="):
+                bounds.setdefault(filtr["field"], set()).add(filtr["operator"][0])
+        covered = [field for field in bounds
+                   if not equalities - set([field]) or
+                   (frozenset(equalities - set([field])), field)
+                   in SESSION_RANGE_INDEXES]
+        rangeField = None
+        if covered:
+            rangeField = max(covered, key=lambda field:
+                (len(bounds[field]), -SESSION_RANGE_FIELDS.index(field)))
+
+        q = Session.query()
+        residual = []
+        for filtr in filters:
+            if filtr["operator"] == "=" or (filtr["field"] == rangeField
+                    and filtr["operator"] != "!="):
+                prop = getattr(Session, filtr["field"])
+                q = q.filter(COMPARISONS[filtr["operator"]](prop, filtr["value"]))
+            else:
+                residual.append(filtr)
+        # the range property must be the first sort order
+        if rangeField:
+            q = q.order(getattr(Session, rangeField))
+        return q, residual
+
+
+    def _fetchResidualPage(self, query, residual, pageSize, cursor):
+        """Stream query in batches applying residual filters until a page of
+        matches is found; return (sessions, next cursor).
+
+        Full entities are scanned: a projection of the residual properties
+        would need a composite index for every planner combination.
+        """
+        return self._fetchFilteredPage(query,
+            lambda sess: all(
+                COMPARISONS[f["operator"]](getattr(sess, f["field"]), f["value"])
+                for f in residual),
+            pageSize, cursor)
+
+
+    def _fetchFilteredPage(self, query, keep, pageSize, cursor):
+        """Stream query in batches keeping entities for which keep() is true
+        until a page is full; return (entities, next cursor).
+        """
+        pageSize, startCursor = self._pageArgs(pageSize, cursor)
+        it = query.iter(start_cursor=startCursor, produce_cursors=True,
+            batch_size=RESIDUAL_BATCH_SIZE)
+        matches = []
+        scanned = 0
+        for entity in it:
+            scanned += 1
+            if keep(entity):
+                matches.append(entity)
+                if len(matches) == pageSize:
+                    break
+            # bound the work per request; the cursor resumes the scan
+            if scanned >= MAX_SCANNED_PER_PAGE:
+                break
+        nextCursor = it.cursor_after().urlsafe() if it.has_next() else None
+        return matches, nextCursor
+
+
+    def _querySessions(self, filters, pageSize=None, cursor=None):
+        """Run session query filters; return a page as SessionForms."""
+        filters = self._formatSessionFilters(filters)
+        q, residual = self._planSessionQuery(filters)
+        if residual:
+            sessions, nextCursor = self._fetchResidualPage(
+                q, residual, pageSize, cursor)
+        else:
+            sessions, nextCursor = self._fetchPage(q, pageSize, cursor)
+        return SessionForms(
+            items=[self._copySessionToForm(sess) for sess in sessions],
+            nextCursor=nextCursor
+        )
+
+
+    @instrument.method(SESS_WINDOW_GET_REQUEST, SessionForms,
+            path='conference/session/window',
+            http_method='GET', name='getSessionsInWindow')
+    def getSessionsInWindow(self, request):
+        """Return sessions overlapping startTime-endTime on a date, across
+        all conferences or within websafeConferenceKey's.
+        """
+        try:
+            day = datetime.strptime(request.date[:10], "%Y-%m-%d").date()
+            start, end = [datetime.strptime(value[:5], "%H:%M").time()
+                          for value in (request.startTime, request.endTime)]
+        except (TypeError, ValueError):
+            raise endpoints.BadRequestException(
+                "date (YYYY-MM-DD), startTime and endTime (HH:MM) required")
+        if end <= start:
+            raise endpoints.BadRequestException("endTime must be after startTime")
+        base = day.toordinal() * 24 * 60
+        window = (base + start.hour * 60 + start.minute,
+                  base + end.hour * 60 + end.minute)
+
+        # one range scan over the slot index finds every session sharing a
+        # slot with the window; slots are coarse, so check exact times
+        slots = Session.slotsFor(window)
+        if request.websafeConferenceKey:
+            q = Session.query(ancestor=ndb.Key(urlsafe=request.websafeConferenceKey))
+        else:
+            q = Session.query()
+        q = q.filter(Session.timeSlots >= slots[0], Session.timeSlots <= slots[-1])\
+            .order(Session.timeSlots)
+        sessions, nextCursor = self._fetchFilteredPage(q,
+            lambda sess: Session.overlaps(sess.span(), window),
+            request.pageSize, request.cursor)
+        return SessionForms(
+            items=[self._copySessionToForm(sess) for sess in sessions],
+            nextCursor=nextCursor
+        )
 
 
-    @endpoints.method(SessionFirstQueryForm, SessionForms,
+    @instrument.method(SessionQueryForms, SessionForms,
+            path='querySessions',
+            http_method='POST',
+            name='querySessions')
+    def querySessions(self, request):
+        """Query for sessions across all conferences, one page at a time."""
+        return self._querySessions(request.filters, request.pageSize, request.cursor)
+
+
+    @instrument.method(SessionFirstQueryForm, SessionForms,
             path='conference/session/sessionQueryByDateStartTime',
             http_method='GET', name='sessionQueryByDateStartTime')
     def sessionQueryByDateStartTime(self, request):
         """Query that retrieves sessions on a certain date & after a certain start time"""
-        # Retrieve user input
-        data = {field.name: getattr(request, field.name) for field in request.all_fields()}
-        # Query with user inputs as filters
-        q=Session.query()
-        q=q.filter(Session.date==datetime.strptime(data['date'][:10], "%Y-%m-%d").date())
-        q=q.filter(Session.startTime>datetime.strptime(data['startTime'][:5], "%H:%M").time())
-        q=q.fetch()
-        # Return response of query
-        return SessionForms(
-            items=[self._copySessionToForm(sess) for sess in q]
-            )
+        return self._querySessions([
+            SessionQueryForm(field='DATE', operator='EQ', value=request.date),
+            SessionQueryForm(field='START_TIME', operator='GT', value=request.startTime),
+        ], request.pageSize, request.cursor)
 
-    @endpoints.method(SessionSecondQueryForm, SessionForms,
+    @instrument.method(SessionSecondQueryForm, SessionForms,
             path='conference/session/sessionQueryByDateStartTimeType',
             http_method='GET', name='sessionQueryByDateStartTimeType')
     def sessionQueryByDateStartTimeType(self, request):
         """Query that retrieves sessions on a certain date, after a certain time & with a certain type."""
-        data = {field.name: getattr(request, field.name) for field in request.all_fields()}
-        q=Session.query()
-        q=q.filter(Session.date==datetime.strptime(data['date'][:10], "%Y-%m-%d").date()) 
-        q=q.filter(Session.typeOfSession==data['typeOfSession']) 
-        q=q.filter(Session.startTime>datetime.strptime(data['startTime'][:5], "%H:%M").time()) 
-        q=q.fetch()
-        return SessionForms(
-            items=[self._copySessionToForm(sess) for sess in q]
-            )
+        return self._querySessions([
+            SessionQueryForm(field='DATE', operator='EQ', value=request.date),
+            SessionQueryForm(field='TYPE_OF_SESSION', operator='EQ', value=request.typeOfSession),
+            SessionQueryForm(field='START_TIME', operator='GT', value=request.startTime),
+        ], request.pageSize, request.cursor)
 
-    @endpoints.method(message_types.VoidMessage, SessionForms,
+    @instrument.method(PAGE_GET_REQUEST, SessionForms,
             path='conference/session/challengeQuery',
             http_method='GET', name='challengeQuery')
     def challengeQuery(self, request):
-        """Query challenge for retrieving two inequalities"""
-        output = []
-        # Query retrieving all sessions that are before 7pm 
-        # and ordered by start time 
-        q=Session.query()
-        q=q.filter(Session.startTime<time(19, 0, 0, tzinfo=None))
-        q=q.order(Session.startTime)
-        q=q.fetch()
-
-        # Iterate through query result and remove all workshop items
-        for i in q:
-            if i.typeOfSession != 'workshop':
-                output.append(i)
-        
-        return SessionForms(
-            items=[self._copySessionToForm(sess) for sess in output]
-            )
+        """Query challenge for retrieving two inequalities: non-workshop
+        sessions before 7pm, ordered by start time.
+        """
+        # startTime range goes to the datastore, "!= workshop" is residual
+        return self._querySessions([
+            SessionQueryForm(field='START_TIME', operator='LT', value='19:00'),
+            SessionQueryForm(field='TYPE_OF_SESSION', operator='NE', value='workshop'),
+        ], request.pageSize, request.cursor)
 
 api = endpoints.api_server([ConferenceApi]) # register API
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+"""instrument.py
+
+Udacity conference server-side Python App Engine request instrumentation
+
+A sampled fraction of endpoint calls and handler requests is timed and
+its API calls counted with rpcstats.  Samples are summed per name into
+WINDOW_SECONDS windows of counters and latency histogram buckets, kept
+in process and flushed to memcache in batches; getStats() adds up the
+most recent windows across all instances.
+
+$Id$
+
+"""
+
+import random
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+import endpoints
+from google.appengine.api import memcache
+
+from settings import STATS_SAMPLE_RATE
+import rpcstats
+
+STATS_PREFIX = "REQUEST_STATS:"
+WINDOW_SECONDS = 5 * 60
+DEFAULT_WINDOWS = 12            # an hour of windows
+MAX_WINDOWS = 24 * 12
+FLUSH_EVERY = 20                # samples kept in process between flushes
+FLUSH_SECONDS = 30
+# upper bounds in milliseconds of the latency histogram buckets; a last
+# bucket takes everything slower
+BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+COUNTERS = ('calls', 'errors', 'wallMs', 'datastoreRpcs', 'entitiesRead',
+            'entitiesWritten', 'memcacheHits', 'memcacheMisses',
+            'tasksEnqueued')
+
+_names = set()
+_pending = Counter()
+_pendingSamples = 0
+_lastFlush = time.time()
+_lock = threading.Lock()
+
+
+def register(name):
+    """Make name show up in getStats()."""
+    _names.add(name)
+
+
+def method(*args, **kwargs):
+    """endpoints.method that also samples the method's cost."""
+    decorate = endpoints.method(*args, **kwargs)
+
+    def decorator(func):
+        return decorate(sampled(kwargs.get('name') or func.__name__)(func))
+    return decorator
+
+
+def sampled(name):
+    """Decorator recording a sample of the calls to the function as name."""
+    register(name)
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return call(name, func, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def call(name, func, *args, **kwargs):
+    """Return func(*args, **kwargs), recording a sample of calls as name."""
+    # a single comparison is all an unsampled call pays
+    if random.random() >= STATS_SAMPLE_RATE:
+        return func(*args, **kwargs)
+    failed = True
+    start = time.time()
+    try:
+        with rpcstats.counting() as counts:
+            result = func(*args, **kwargs)
+        failed = False
+    finally:
+        _record(name, counts, (time.time() - start) * 1000, failed)
+    return result
+
+
+def _bucket(ms):
+    for i, bound in enumerate(BUCKETS_MS):
+        if ms <= bound:
+            return i
+    return len(BUCKETS_MS)
+
+
+def _record(name, counts, ms, failed):
+    global _pendingSamples
+    prefix = '%d:%s:' % (int(time.time()) // WINDOW_SECONDS, name)
+    sample = {
+        'calls': 1,
+        'errors': int(failed),
+        'wallMs': int(round(ms)),
+        'datastoreRpcs': sum(count for stat, count in counts.iteritems()
+                             if stat.startswith('datastore_v3.')),
+        'b%d' % _bucket(ms): 1,
+    }
+    for stat in COUNTERS[4:]:
+        sample[stat] = counts[stat]
+    with _lock:
+        for stat, value in sample.iteritems():
+            if value:
+                _pending[prefix + stat] += value
+        _pendingSamples += 1
+        due = (_pendingSamples >= FLUSH_EVERY or
+               time.time() - _lastFlush >= FLUSH_SECONDS)
+    if due:
+        _flush()
+
+
+def _flush():
+    global _pendingSamples, _lastFlush
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _pendingSamples = 0
+        _lastFlush = time.time()
+    if pending:
+        memcache.offset_multi(pending, key_prefix=STATS_PREFIX, initial_value=0)
+
+
+def _percentile(histogram, fraction):
+    """Return the bucket bound below which fraction of samples fell."""
+    total = sum(histogram)
+    seen = 0
+    for i, count in enumerate(histogram):
+        seen += count
+        if seen >= fraction * total:
+            return BUCKETS_MS[i] if i < len(BUCKETS_MS) else None
+    return None
+
+
+def getStats(windows=DEFAULT_WINDOWS):
+    """Return a dict of per-name stats over the latest windows."""
+    windows = max(1, min(windows, MAX_WINDOWS))
+    _flush()
+    now = int(time.time()) // WINDOW_SECONDS
+    prefixes = ['%d:%s:' % (window, name)
+                for window in range(now - windows + 1, now + 1)
+                for name in _names]
+    # read all counters only for names that were sampled at all
+    calls = memcache.get_multi([prefix + 'calls' for prefix in prefixes],
+                               key_prefix=STATS_PREFIX)
+    prefixes = [prefix for prefix in prefixes if calls.get(prefix + 'calls')]
+    stats = ['b%d' % i for i in range(len(BUCKETS_MS) + 1)] + list(COUNTERS)
+    values = memcache.get_multi([prefix + stat for prefix in prefixes
+                                 for stat in stats], key_prefix=STATS_PREFIX)
+
+    totals = {}
+    for prefix in prefixes:
+        name = prefix.split(':', 1)[1][:-1]
+        total = totals.setdefault(name, Counter())
+        for stat in stats:
+            total[stat] += values.get(prefix + stat, 0)
+
+    methods = {}
+    for name, total in totals.iteritems():
+        calls = total['calls']
+        histogram = [total['b%d' % i] for i in range(len(BUCKETS_MS) + 1)]
+        methods[name] = {
+            'sampledCalls': calls,
+            'estimatedCalls': int(round(calls / STATS_SAMPLE_RATE))
+                              if STATS_SAMPLE_RATE else None,
+            'errors': total['errors'],
+            'p50Ms': _percentile(histogram, 0.5),
+            'p95Ms': _percentile(histogram, 0.95),
+            'p99Ms': _percentile(histogram, 0.99),
+            'histogramMs': dict(
+                [('<=%d' % bound, count) for bound, count in zip(BUCKETS_MS, histogram)] +
+                [('>%d' % BUCKETS_MS[-1], histogram[-1])]),
+            'perCall': dict((stat, float(total[stat]) / calls)
+                            for stat in COUNTERS[2:]),
+        }
+    return {
+        'sampleRate': STATS_SAMPLE_RATE,
+        'windowSeconds': WINDOW_SECONDS,
+        'windows': windows,
+        'methods': methods,
+    }
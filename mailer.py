@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+"""mailer.py
+
+Udacity conference server-side Python App Engine confirmation mailer
+
+Confirmation emails are queued as small tasks on the "mail" pull queue
+and sent by a cron job that leases them in batches, sending at most
+MAIL_SEND_RATE emails per run.  Bodies are rendered from the stored
+Conference when the email is sent.  A memcache marker per task keeps a
+task whose lease expired after its email went out from being sent twice.
+
+$Id$
+
+"""
+
+import json
+import time
+from collections import Counter
+
+from google.appengine.api import app_identity
+from google.appengine.api import mail
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+from google.appengine.runtime import apiproxy_errors
+
+from settings import MAIL_SEND_RATE
+
+MAIL_QUEUE = 'mail'
+LEASE_SECONDS = 60
+LEASE_BATCH_SIZE = 100
+MAX_ATTEMPTS = 5
+SENT_PREFIX = "MAIL_SENT:"
+SENT_TTL = 24 * 60 * 60
+STATS_PREFIX = "MAIL_STATS:"
+CONFIRMATION_SUBJECT = 'You created a new Conference!'
+CONFIRMATION_TPL = ('Hi, you have created the following conference:\r\n\r\n'
+                    '%(name)s\r\n'
+                    'City: %(city)s\r\n'
+                    'Dates: %(startDate)s to %(endDate)s\r\n'
+                    'Topics: %(topics)s\r\n'
+                    'Seats: %(maxAttendees)s\r\n')
+
+
+def queueConfirmation(email, c_key):
+    """Queue the creation confirmation of Conference c_key to email;
+    queueing it again is a no-op.
+    """
+    try:
+        taskqueue.Queue(MAIL_QUEUE).add(taskqueue.Task(
+            name='confirm-' + c_key.urlsafe(), method='PULL',
+            payload=json.dumps({'email': email, 'conference': c_key.urlsafe()})))
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        pass
+
+
+def renderConfirmation(conf):
+    """Return the confirmation email body for a Conference."""
+    return CONFIRMATION_TPL % {
+        'name': conf.name,
+        'city': conf.city or '-',
+        'startDate': conf.startDate or '-',
+        'endDate': conf.endDate or '-',
+        'topics': ', '.join(conf.topics) or '-',
+        'maxAttendees': conf.maxAttendees or '-',
+    }
+
+
+def sendQueued(budget=MAIL_SEND_RATE):
+    """Lease queued emails in batches and send up to budget of them;
+    return a Counter of sent, duplicate, failed and dropped emails.
+    """
+    queue = taskqueue.Queue(MAIL_QUEUE)
+    counts = Counter()
+    started = time.time()
+    leased = 0
+    while leased < budget:
+        tasks = queue.lease_tasks(LEASE_SECONDS,
+            min(LEASE_BATCH_SIZE, budget - leased))
+        if not tasks:
+            break
+        leased += len(tasks)
+        done = _sendTasks(tasks, counts)
+        if done:
+            queue.delete_tasks(done)
+    memcache.offset_multi(dict(counts), key_prefix=STATS_PREFIX, initial_value=0)
+    memcache.set_multi({'lastRunSent': counts['sent'],
+        'lastRunSeconds': time.time() - started}, key_prefix=STATS_PREFIX)
+    return counts
+
+
+def _sendTasks(tasks, counts):
+    """Send the emails of leased tasks; return the tasks that are done
+    with.  Failed sends stay leased and are retried when the lease expires.
+    """
+    payloads = [json.loads(task.payload) for task in tasks]
+    confs = ndb.get_multi([ndb.Key(urlsafe=p['conference']) for p in payloads])
+    # claim every task with one memcache call; already claimed ones were sent
+    claimed = set(task.name for task in tasks) - set(memcache.add_multi(
+        {task.name: 1 for task in tasks}, key_prefix=SENT_PREFIX, time=SENT_TTL))
+    sender = 'noreply@%s.appspotmail.com' % app_identity.get_application_id()
+
+    done = []
+    for task, payload, conf in zip(tasks, payloads, confs):
+        if task.name not in claimed:
+            counts['duplicates'] += 1
+        elif not conf or task.retry_count >= MAX_ATTEMPTS:
+            counts['dropped'] += 1
+        else:
+            try:
+                mail.send_mail(sender, payload['email'],
+                    CONFIRMATION_SUBJECT, renderConfirmation(conf))
+            except mail.Error:
+                # bad address and the like; retrying will not help
+                counts['dropped'] += 1
+            except apiproxy_errors.Error:
+                memcache.delete(SENT_PREFIX + task.name)
+                counts['failed'] += 1
+                continue
+            else:
+                counts['sent'] += 1
+        done.append(task)
+    return done
+
+
+def getStats():
+    """Return a dict of mailer counters plus the queue backlog."""
+    stats = memcache.get_multi(['sent', 'duplicates', 'failed', 'dropped',
+        'lastRunSent', 'lastRunSeconds'], key_prefix=STATS_PREFIX)
+    queueStats = taskqueue.Queue(MAIL_QUEUE).fetch_statistics()
+    stats['backlog'] = queueStats.tasks
+    if queueStats.oldest_eta_usec:
+        stats['oldestTaskAge'] = int(time.time() - queueStats.oldest_eta_usec / 1e6)
+    return stats
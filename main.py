@@ -12,23 +12,54 @@ created by wesc on 2014 may 24
 
 __author__ = 'wesc+api@google.com (Wesley Chun)'
 
+import json
+import time
+
 import webapp2
 from google.appengine.api import app_identity
+from google.appengine.api import datastore_errors
 from google.appengine.api import mail
+from google.appengine.api import taskqueue
+from google.appengine.datastore.datastore_query import Cursor
 from conference import ConferenceApi
-from models import Session
 from google.appengine.ext import ndb
+from models import Profile
+from models import Session
+import bulkdata
+import cache
+import instrument
+import mailer
+import searchindex
+import seats
+
+MIGRATION_PAGE_SIZE = 100
+
+
+class InstrumentedHandler(webapp2.RequestHandler):
+    def dispatch(self):
+        """Dispatch the request, recording a sample of its cost."""
+        name = self.request.route.template if self.request.route else self.request.path
+        instrument.call(name, super(InstrumentedHandler, self).dispatch)
+
 
-class SetAnnouncementHandler(webapp2.RequestHandler):
+class SetAnnouncementHandler(InstrumentedHandler):
     def get(self):
-        """Set Announcement in Memcache."""
+        """Reconcile nearly sold out conferences & set Announcement in Memcache."""
         ConferenceApi._cacheAnnouncement()
         self.response.set_status(204)
 
 
-class SendConfirmationEmailHandler(webapp2.RequestHandler):
+class SendMailHandler(InstrumentedHandler):
+    def get(self):
+        """Send a rate limited batch of queued confirmation emails."""
+        mailer.sendQueued()
+        self.response.set_status(204)
+
+
+class SendConfirmationEmailHandler(InstrumentedHandler):
     def post(self):
-        """Send email confirming Conference creation."""
+        """Send email confirming Conference creation (push tasks queued
+        before the mail pull queue)."""
         mail.send_mail(
             'noreply@%s.appspotmail.com' % (
                 app_identity.get_application_id()),     # from
@@ -40,28 +71,180 @@ class SendConfirmationEmailHandler(webapp2.RequestHandler):
         )
 
 
-class DetermineFeaturedSpeakerHandler(webapp2.RequestHandler):
+class DetermineFeaturedSpeakerHandler(InstrumentedHandler):
     def post(self):
         """Set announcement in Memcache for featured speaker and sessions"""
         # Assume that speaker names are unique
         # otherwise would have to introduce a speaker key
-        featuredSpeaker = ""
+        # One task covers every session created in the conference during
+        # the coalescing interval; recompute from the speaker aggregates
         wsck = self.request.get('websafeConferenceKey')
-        speakerName = self.request.get('speaker')
-        # Count how many times a speaker is assigned to sessions in a particular conference
-        speakerCount = Session.query(ancestor=ndb.Key(urlsafe=wsck)).filter(Session.speaker == speakerName).count()
-        # Speaker is featured if there is more than one session by speaker in conference
-        if speakerCount > 1:
-            featuredSpeaker = speakerName
-            # Retrieve sessions the speaker is speaking
-            featuredSpeakerSessions = Session.query(ancestor=ndb.Key(urlsafe=wsck)).filter(Session.speaker == featuredSpeaker)
-        # Set announcement for featured speaker and sessions in memcache
-        ConferenceApi._cacheSpeakerAnnouncement(featuredSpeaker, featuredSpeakerSessions)
+        ConferenceApi._cacheSpeakerAnnouncement(ndb.Key(urlsafe=wsck))
+        self.response.set_status(204)
+
+
+class SyncSeatsHandler(InstrumentedHandler):
+    def post(self):
+        """Fold sharded seat counts back into the Conference entity."""
+        synced = seats.syncConference(ndb.Key(urlsafe=self.request.get('websafeConferenceKey')))
+        if synced:
+            ConferenceApi._onSeatsChanged(*synced)
         self.response.set_status(204)
 
 
+class ExportHandler(InstrumentedHandler):
+    def get(self):
+        """Write one page of the JSON lines dump; its X-Next-Cursor
+        header, passed back as ?cursor=, fetches the next page."""
+        try:
+            lines, token = bulkdata.exportPage(self.request.get('cursor') or None)
+        except (ValueError, datastore_errors.Error) as e:
+            self.abort(400, detail=str(e))
+        self.response.headers['Content-Type'] = 'application/x-ndjson'
+        if token:
+            self.response.headers['X-Next-Cursor'] = token
+        for line in lines:
+            self.response.write(line + '\n')
+
+
+class ImportHandler(InstrumentedHandler):
+    def post(self):
+        """Import JSON lines from the body, skipping the first ?checkpoint=
+        lines; reply with the checkpoint to resume from."""
+        checkpoint = int(self.request.get('checkpoint') or 0)
+        deadline = time.time() + bulkdata.IMPORT_TIME_BUDGET
+        result = {'done': False}
+        try:
+            for checkpoint in bulkdata.importLines(self.request.body_file, checkpoint):
+                if time.time() > deadline:
+                    break
+            else:
+                result['done'] = True
+        except ValueError as e:
+            self.response.set_status(400)
+            result['error'] = str(e)
+        result['checkpoint'] = checkpoint
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(result))
+
+
+class MigrateProfilesHandler(InstrumentedHandler):
+    def post(self):
+        """Move one page of Profiles' registrations and wishlists onto
+        child entities, then queue the next page."""
+        cursor = self.request.get('cursor')
+        profiles, next_cursor, more = Profile.query().fetch_page(
+            MIGRATION_PAGE_SIZE,
+            start_cursor=Cursor(urlsafe=cursor) if cursor else None)
+        for prof in profiles:
+            if prof.conferenceKeysToAttend or prof.sessionWishListKeys:
+                ConferenceApi._migrateProfile(prof.key)
+        if more and next_cursor:
+            taskqueue.add(url='/admin/migrate_profiles',
+                params={'cursor': next_cursor.urlsafe()})
+        self.response.set_status(204)
+
+
+class BackfillSpeakersHandler(InstrumentedHandler):
+    def post(self):
+        """Count one page of Sessions stored before speakerId on their
+        speakers, then queue the next page."""
+        cursor = self.request.get('cursor')
+        sessions, next_cursor, more = Session.query().fetch_page(
+            MIGRATION_PAGE_SIZE,
+            start_cursor=Cursor(urlsafe=cursor) if cursor else None)
+        ConferenceApi._backfillSpeakers(sessions)
+        if more and next_cursor:
+            taskqueue.add(url='/admin/backfill_speakers',
+                params={'cursor': next_cursor.urlsafe()})
+        self.response.set_status(204)
+
+
+class BackfillSessionTimesHandler(InstrumentedHandler):
+    def post(self):
+        """Store the time range of one page of Sessions stored before it
+        existed, then queue the next page."""
+        cursor = self.request.get('cursor')
+        sessions, next_cursor, more = Session.query().fetch_page(
+            MIGRATION_PAGE_SIZE,
+            start_cursor=Cursor(urlsafe=cursor) if cursor else None)
+        ConferenceApi._backfillSessionTimes(sessions)
+        if more and next_cursor:
+            taskqueue.add(url='/admin/backfill_session_times',
+                params={'cursor': next_cursor.urlsafe()})
+        self.response.set_status(204)
+
+
+class ReindexHandler(InstrumentedHandler):
+    def post(self):
+        """Rebuild the search documents of one page of entities, then
+        queue the next page (conferences first, then sessions)."""
+        kinds = [kind for kind, _, _ in searchindex.REINDEX_KINDS]
+        kind = self.request.get('kind') or kinds[0]
+        if kind not in kinds:
+            self.abort(400, detail='Unknown kind: %s' % kind)
+        cursor = searchindex.reindexPage(kind, self.request.get('cursor') or None)
+        if cursor:
+            taskqueue.add(url='/admin/reindex',
+                params={'kind': kind, 'cursor': cursor})
+        elif kinds.index(kind) + 1 < len(kinds):
+            taskqueue.add(url='/admin/reindex',
+                params={'kind': kinds[kinds.index(kind) + 1]})
+        self.response.set_status(204)
+
+
+class RebuildFacetsHandler(InstrumentedHandler):
+    def post(self):
+        """Recount conference facets from the datastore."""
+        ConferenceApi._rebuildFacets()
+        self.response.set_status(204)
+
+
+class StatsHandler(InstrumentedHandler):
+    def get(self):
+        """Report sampled latency histograms and API call counts per
+        endpoint method and handler over the last ?windows= windows."""
+        try:
+            windows = int(self.request.get('windows') or instrument.DEFAULT_WINDOWS)
+        except ValueError:
+            self.abort(400, detail='windows must be an integer')
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(instrument.getStats(windows),
+                                       indent=2, sort_keys=True))
+
+
+class CacheStatsHandler(InstrumentedHandler):
+    def get(self):
+        """Report read-through cache hit/miss counters."""
+        hits, misses = cache.getStats()
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps({'hits': hits, 'misses': misses}))
+
+
+class MailStatsHandler(InstrumentedHandler):
+    def get(self):
+        """Report confirmation mailer throughput and backlog."""
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(mailer.getStats(), sort_keys=True))
+
+
 app = webapp2.WSGIApplication([
     ('/crons/set_announcement', SetAnnouncementHandler),
+    ('/crons/send_mail', SendMailHandler),
     ('/tasks/send_confirmation_email', SendConfirmationEmailHandler),
     ('/tasks/determine_featured_speaker', DetermineFeaturedSpeakerHandler),
+    ('/tasks/sync_seats', SyncSeatsHandler),
+    ('/admin/export', ExportHandler),
+    ('/admin/import', ImportHandler),
+    ('/admin/migrate_profiles', MigrateProfilesHandler),
+    ('/admin/backfill_speakers', BackfillSpeakersHandler),
+    ('/admin/backfill_session_times', BackfillSessionTimesHandler),
+    ('/admin/reindex', ReindexHandler),
+    ('/admin/rebuild_facets', RebuildFacetsHandler),
+    ('/admin/stats', StatsHandler),
+    ('/admin/cache_stats', CacheStatsHandler),
+    ('/admin/mail_stats', MailStatsHandler),
 ], debug=True)
+
+for route in app.router.match_routes:
+    instrument.register(route.template)
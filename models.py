@@ -17,6 +17,8 @@ import endpoints
 from protorpc import messages
 from google.appengine.ext import ndb
 
+SLOT_MINUTES = 30       # width of Session.timeSlots buckets
+
 class ConflictException(endpoints.ServiceException):
     """ConflictException -- exception mapped to HTTP 409 response"""
     http_status = httplib.CONFLICT
@@ -26,9 +28,33 @@ class Profile(ndb.Model):
     displayName = ndb.StringProperty()
     mainEmail = ndb.StringProperty()
     teeShirtSize = ndb.StringProperty(default='NOT_SPECIFIED')
+    # legacy lists, moved to Registration and WishlistEntry children on first use
     conferenceKeysToAttend = ndb.StringProperty(repeated=True)
     sessionWishListKeys = ndb.StringProperty(repeated = True)
 
+class Registration(ndb.Model):
+    """Registration -- a Profile's registration for a Conference; child of
+    the Profile with the Conference's websafe key as id"""
+    conference = ndb.KeyProperty(kind='Conference', required=True)
+
+    @staticmethod
+    def keyFor(p_key, c_key):
+        """Return the key of Profile p_key's registration for c_key."""
+        return ndb.Key(Registration, c_key.urlsafe(), parent=p_key)
+
+class WishlistEntry(ndb.Model):
+    """WishlistEntry -- a Session in a Profile's wishlist; child of the
+    Profile with the Session's websafe key as id"""
+    conference = ndb.KeyProperty(kind='Conference', required=True)
+    session = ndb.KeyProperty(kind='Session', required=True, indexed=False)
+    # the Session's timeSlots, for conflict checks
+    timeSlots = ndb.IntegerProperty(repeated=True)
+
+    @staticmethod
+    def keyFor(p_key, s_key):
+        """Return the key of Profile p_key's wishlist entry for s_key."""
+        return ndb.Key(WishlistEntry, s_key.urlsafe(), parent=p_key)
+
 class ProfileMiniForm(messages.Message):
     """ProfileMiniForm -- update Profile form message"""
     displayName = messages.StringField(1)
@@ -42,14 +68,43 @@ class ProfileForm(messages.Message):
     conferenceKeysToAttend = messages.StringField(4, repeated=True)
     sessionWishListKeys = messages.StringField(5, repeated=True)
 
+class AttendeeForm(messages.Message):
+    """AttendeeForm -- conference attendee outbound form message"""
+    displayName = messages.StringField(1)
+    mainEmail = messages.StringField(2)
+    teeShirtSize = messages.EnumField('TeeShirtSize', 3)
+
+class AttendeeForms(messages.Message):
+    """AttendeeForms -- page of conference attendees outbound form message"""
+    items = messages.MessageField(AttendeeForm, 1, repeated=True)
+    nextCursor = messages.StringField(2)
+
 class StringMessage(messages.Message):
     """StringMessage-- outbound (single) string message"""
     data = messages.StringField(1, required=True)
 
+class AnnouncementForm(messages.Message):
+    """AnnouncementForm -- outbound announcement with its ETag"""
+    data = messages.StringField(1)
+    etag = messages.StringField(2)
+    notModified = messages.BooleanField(3)
+
 class BooleanMessage(messages.Message):
     """BooleanMessage-- outbound Boolean value message"""
     data = messages.BooleanField(1)
 
+class FacetCountForm(messages.Message):
+    """FacetCountForm -- number of conferences with one facet value"""
+    value = messages.StringField(1)
+    count = messages.IntegerField(2)
+
+class ConferenceFacetsForm(messages.Message):
+    """ConferenceFacetsForm -- outbound conference counts per facet value"""
+    cities = messages.MessageField(FacetCountForm, 1, repeated=True)
+    topics = messages.MessageField(FacetCountForm, 2, repeated=True)
+    months = messages.MessageField(FacetCountForm, 3, repeated=True)
+    seats = messages.MessageField(FacetCountForm, 4, repeated=True)
+
 class Conference(ndb.Model):
     """Conference -- Conference object"""
     name            = ndb.StringProperty(required=True)
@@ -62,6 +117,19 @@ class Conference(ndb.Model):
     endDate         = ndb.DateProperty()
     maxAttendees    = ndb.IntegerProperty()
     seatsAvailable  = ndb.IntegerProperty()
+    seatShards      = ndb.IntegerProperty(default=0, indexed=False)
+
+class NearlySoldOut(ndb.Model):
+    """NearlySoldOut -- singleton of conferences with 1-5 seats available"""
+    conferenceNames = ndb.JsonProperty()    # websafe key -> name
+
+class ConferenceFacets(ndb.Model):
+    """ConferenceFacets -- shard of conference counts per facet value"""
+    counts = ndb.JsonProperty()     # facet -> {value: conference count}
+
+class SeatShard(ndb.Model):
+    """SeatShard -- slice of a Conference's available seats (root entity)"""
+    seatsAvailable  = ndb.IntegerProperty(default=0, indexed=False)
 
 class ConferenceForm(messages.Message):
     """ConferenceForm -- Conference outbound form message"""
@@ -77,10 +145,15 @@ class ConferenceForm(messages.Message):
     endDate         = messages.StringField(10) #DateTimeField()
     websafeKey      = messages.StringField(11)
     organizerDisplayName = messages.StringField(12)
+    rpcCount        = messages.IntegerField(13, variant=messages.Variant.INT32)
+    etag            = messages.StringField(14)
+    notModified     = messages.BooleanField(15)
 
 class ConferenceForms(messages.Message):
     """ConferenceForms -- multiple Conference outbound form message"""
     items = messages.MessageField(ConferenceForm, 1, repeated=True)
+    nextCursor = messages.StringField(2)
+    rpcCount = messages.IntegerField(3, variant=messages.Variant.INT32)
 
 class TeeShirtSize(messages.Enum):
     """TeeShirtSize -- t-shirt size enumeration value"""
@@ -109,6 +182,8 @@ class ConferenceQueryForm(messages.Message):
 class ConferenceQueryForms(messages.Message):
     """ConferenceQueryForms -- multiple ConferenceQueryForm inbound form message"""
     filters = messages.MessageField(ConferenceQueryForm, 1, repeated=True)
+    pageSize = messages.IntegerField(2, variant=messages.Variant.INT32)
+    cursor = messages.StringField(3)
 
 # - - - Session Models - - - - - - - - - - - - - - - - -
 
@@ -121,6 +196,37 @@ class Session(ndb.Model):
     typeOfSession   = ndb.StringProperty()
     date            = ndb.DateProperty()
     startTime       = ndb.TimeProperty()
+    speakerId       = ndb.ComputedProperty(lambda self: Speaker.normalize(self.speaker))
+    # minutes since midnight; duration is a length stored as a time of day
+    startMinute     = ndb.ComputedProperty(lambda self: None if self.startTime is None
+        else self.startTime.hour * 60 + self.startTime.minute, indexed=False)
+    endMinute       = ndb.ComputedProperty(lambda self: None if self.startTime is None
+        else self.startMinute + (self.duration.hour * 60 + self.duration.minute
+                                 if self.duration else 0), indexed=False)
+    # SLOT_MINUTES buckets the session overlaps, for time window queries
+    timeSlots       = ndb.ComputedProperty(lambda self: Session.slotsFor(self.span()),
+        repeated=True)
+
+    def span(self):
+        """Return (start, end) in minutes since 0001-01-01, or None if the
+        session has no date or start time; sessions last at least a minute.
+        """
+        if self.date is None or self.startTime is None:
+            return None
+        start = self.date.toordinal() * 24 * 60 + self.startMinute
+        return start, start + max(self.endMinute - self.startMinute, 1)
+
+    @staticmethod
+    def slotsFor(span):
+        """Return the time-slot buckets a (start, end) span overlaps."""
+        if not span:
+            return []
+        return range(span[0] // SLOT_MINUTES, (span[1] - 1) // SLOT_MINUTES + 1)
+
+    @staticmethod
+    def overlaps(span, other):
+        """Return whether two (start, end) spans overlap."""
+        return bool(span and other) and span[0] < other[1] and other[0] < span[1]
 
 class SessionForm(messages.Message):
     """ SessionForm -- Session outbound form messages """
@@ -137,14 +243,79 @@ class SessionForm(messages.Message):
 class SessionForms(messages.Message):
     """SessionForms -- multiple Session outbound form message"""
     items = messages.MessageField(SessionForm, 1, repeated=True)
+    nextCursor = messages.StringField(2)
+    rpcCount = messages.IntegerField(3, variant=messages.Variant.INT32)
+    etag = messages.StringField(4)
+    notModified = messages.BooleanField(5)
+
+class SessionKeysForm(messages.Message):
+    """SessionKeysForm -- inbound list of websafe Session keys"""
+    sessionKeys = messages.StringField(1, repeated=True)
+
+class WishlistGroupForm(messages.Message):
+    """WishlistGroupForm -- wishlisted Sessions of one Conference"""
+    websafeConferenceKey = messages.StringField(1)
+    conferenceName = messages.StringField(2)
+    items = messages.MessageField(SessionForm, 3, repeated=True)
+
+class WishlistForms(messages.Message):
+    """WishlistForms -- page of the wishlist grouped by Conference"""
+    groups = messages.MessageField(WishlistGroupForm, 1, repeated=True)
+    nextCursor = messages.StringField(2)
+    rpcCount = messages.IntegerField(3, variant=messages.Variant.INT32)
 
 class SessionFirstQueryForm(messages.Message):
     """SessionFirstQueryForm -- Session query inbound form message for sessionQueryByDateStartTime endpoint"""
     date = messages.StringField(1)
     startTime = messages.StringField(2)
+    pageSize = messages.IntegerField(3, variant=messages.Variant.INT32)
+    cursor = messages.StringField(4)
 
 class SessionSecondQueryForm(messages.Message):
     """SessionFirstQueryForm -- Session query inbound form message for sessionQueryByDateStartTime endpoint"""
     date = messages.StringField(1)
     startTime = messages.StringField(2)
     typeOfSession = messages.StringField(3)
+    pageSize = messages.IntegerField(4, variant=messages.Variant.INT32)
+    cursor = messages.StringField(5)
+
+class SessionQueryForm(messages.Message):
+    """SessionQueryForm -- Session query inbound form message"""
+    field = messages.StringField(1)
+    operator = messages.StringField(2)
+    value = messages.StringField(3)
+
+class SessionQueryForms(messages.Message):
+    """SessionQueryForms -- multiple SessionQueryForm inbound form message"""
+    filters = messages.MessageField(SessionQueryForm, 1, repeated=True)
+    pageSize = messages.IntegerField(2, variant=messages.Variant.INT32)
+    cursor = messages.StringField(3)
+
+# - - - Speaker Models - - - - - - - - - - - - - - - - -
+
+class Speaker(ndb.Model):
+    """Speaker -- speaker index object, keyed by normalized speaker name"""
+    name            = ndb.StringProperty()
+    sessionCount    = ndb.IntegerProperty(default=0)
+
+    @staticmethod
+    def normalize(name):
+        """Return speaker name lowercased with whitespace collapsed."""
+        return ' '.join((name or '').lower().split())
+
+class ConferenceSpeaker(ndb.Model):
+    """ConferenceSpeaker -- a speaker's sessions in one conference; child of
+    Conference keyed by normalized speaker name"""
+    name            = ndb.StringProperty(indexed=False)
+    sessionCount    = ndb.IntegerProperty(default=0)
+    sessionNames    = ndb.StringProperty(repeated=True, indexed=False)
+
+class SpeakerForm(messages.Message):
+    """SpeakerForm -- Speaker outbound form message"""
+    name            = messages.StringField(1)
+    sessionCount    = messages.IntegerField(2, variant=messages.Variant.INT32)
+
+class SpeakerForms(messages.Message):
+    """SpeakerForms -- multiple Speaker outbound form message"""
+    items = messages.MessageField(SpeakerForm, 1, repeated=True)
+    nextCursor = messages.StringField(2)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+"""rpcstats.py
+
+Udacity conference server-side Python App Engine API call accounting
+
+apiproxy hooks count every RPC made by the current thread while a
+counting() block is active: RPCs per service call, datastore entities
+read and written, memcache hits and misses and task queue enqueues.
+
+$Id$
+
+"""
+
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from google.appengine.api import apiproxy_stub_map
+
+_local = threading.local()
+_installed = False
+
+
+def _active():
+    return getattr(_local, 'stack', None)
+
+
+def _add(stat, value=1):
+    for counts in _local.stack:
+        counts[stat] += value
+
+
+def _preCall(service, call, request, response):
+    if _active():
+        _add('rpcs')
+        _add('%s.%s' % (service, call))
+
+
+def _postCall(service, call, request, response):
+    if not _active():
+        return
+    if service == 'datastore_v3':
+        if call == 'Get':
+            _add('entitiesRead', sum(1 for result in response.entity_list()
+                                     if result.has_entity()))
+        elif call in ('RunQuery', 'Next'):
+            _add('entitiesRead', response.result_size())
+        elif call == 'Put':
+            _add('entitiesWritten', request.entity_size())
+        elif call == 'Delete':
+            _add('entitiesWritten', request.key_size())
+    elif service == 'memcache' and call == 'Get':
+        _add('memcacheHits', response.item_size())
+        _add('memcacheMisses', request.key_size() - response.item_size())
+    elif service == 'taskqueue' and call == 'BulkAdd':
+        _add('tasksEnqueued', request.add_request_size())
+
+
+def install():
+    """Register the apiproxy hooks (once per instance)."""
+    global _installed
+    if not _installed:
+        apiproxy = apiproxy_stub_map.apiproxy
+        apiproxy.GetPreCallHooks().Append('rpcstats', _preCall)
+        apiproxy.GetPostCallHooks().Append('rpcstats', _postCall)
+        _installed = True
+
+
+@contextmanager
+def counting():
+    """Count API calls made inside the with block; yields a Counter.
+
+    Blocks may be nested; every active block sees every call.
+    """
+    install()
+    counts = Counter()
+    if _active() is None:
+        _local.stack = []
+    _local.stack.append(counts)
+    try:
+        yield counts
+    finally:
+        # Counters compare by value; equal nested ones must not be confused
+        assert _local.stack[-1] is counts
+        _local.stack.pop()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+"""searchindex.py
+
+Udacity conference server-side Python App Engine full-text search
+
+Conferences and Sessions are mirrored as Search API documents, one index
+per kind, keyed by websafe entity key and rewritten whenever the entity
+is created or changed.  Searches return entity keys ranked by match
+score.  (Not named search.py so as not to shadow the Search API module.)
+
+$Id$
+
+"""
+
+import logging
+
+from google.appengine.api import search
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+from models import Conference
+from models import Session
+
+CONFERENCE_INDEX = 'conferences'
+SESSION_INDEX = 'sessions'
+PUT_BATCH_SIZE = 200        # most documents per Index.put()
+REINDEX_PAGE_SIZE = 200
+
+
+def _conferenceDocument(conf):
+    return search.Document(doc_id=conf.key.urlsafe(), fields=[
+        search.TextField(name='name', value=conf.name),
+        search.TextField(name='description', value=conf.description),
+        search.TextField(name='topics', value=', '.join(conf.topics)),
+        search.TextField(name='city', value=conf.city),
+    ])
+
+
+def _sessionDocument(sess):
+    return search.Document(doc_id=sess.key.urlsafe(), fields=[
+        search.TextField(name='name', value=sess.name),
+        search.TextField(name='highlights', value=', '.join(sess.highlights)),
+        search.TextField(name='speaker', value=sess.speaker),
+    ])
+
+
+def _put(indexName, documents):
+    index = search.Index(name=indexName)
+    for start in range(0, len(documents), PUT_BATCH_SIZE):
+        try:
+            index.put(documents[start:start + PUT_BATCH_SIZE])
+        except search.Error:
+            # the entities are stored regardless; /admin/reindex repairs
+            logging.exception('Could not index %d documents in %s',
+                len(documents[start:start + PUT_BATCH_SIZE]), indexName)
+
+
+def indexConferences(confs):
+    """Add or replace the search documents of Conferences."""
+    _put(CONFERENCE_INDEX, [_conferenceDocument(conf) for conf in confs])
+
+
+def indexSessions(sessions):
+    """Add or replace the search documents of Sessions."""
+    _put(SESSION_INDEX, [_sessionDocument(sess) for sess in sessions])
+
+
+def find(indexName, queryString, limit, cursor=None):
+    """Return (entity keys ranked by match score, next websafe cursor or
+    None); raise ValueError for a bad query or cursor.
+    """
+    options = search.QueryOptions(limit=limit, ids_only=True,
+        cursor=search.Cursor(web_safe_string=cursor) if cursor else search.Cursor(),
+        sort_options=search.SortOptions(match_scorer=search.MatchScorer(),
+            expressions=[search.SortExpression(expression='_score',
+                direction=search.SortExpression.DESCENDING, default_value=0)]))
+    try:
+        results = search.Index(name=indexName).search(
+            search.Query(query_string=queryString, options=options))
+    except (search.QueryError, search.InvalidRequest) as e:
+        raise ValueError(str(e) or 'Invalid search query or cursor')
+    keys = [ndb.Key(urlsafe=doc.doc_id) for doc in results.results]
+    return keys, results.cursor.web_safe_string if results.cursor else None
+
+
+# kind -> (model, indexing function), in reindexing order
+REINDEX_KINDS = [('Conference', Conference, indexConferences),
+                 ('Session', Session, indexSessions)]
+
+
+def reindexPage(kind, cursor=None):
+    """Index one page of a kind's entities; return the next websafe
+    cursor, or None after the last page.
+    """
+    model, index = {k: (m, i) for k, m, i in REINDEX_KINDS}[kind]
+    entities, next_cursor, more = model.query().fetch_page(REINDEX_PAGE_SIZE,
+        start_cursor=Cursor(urlsafe=cursor) if cursor else None)
+    index(entities)
+    return next_cursor.urlsafe() if more and next_cursor else None
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+"""seats.py
+
+Udacity conference server-side Python App Engine sharded seat counter
+
+A Conference's available seats are split over SeatShard root entities so
+that registrations for one popular conference do not all contend on the
+Conference entity group.  Conference.seatsAvailable is folded back from
+the shards by a coalesced task and is only used for queries; reads that
+must be exact sum the shards.
+
+$Id$
+
+"""
+
+from google.appengine.ext import ndb
+
+from models import SeatShard
+from utils import addCoalescedTask
+
+NUM_SHARDS = 10
+SYNC_INTERVAL = 5       # seconds between Conference.seatsAvailable syncs
+SYNC_URL = '/tasks/sync_seats'
+
+
+def shardKeys(conf):
+    """Return SeatShard keys of a sharded Conference."""
+    return shardKeysFor(conf.key, conf.seatShards)
+
+
+def shardKeysFor(c_key, count=NUM_SHARDS):
+    """Return SeatShard keys of a Conference key with count shards."""
+    wsck = c_key.urlsafe()
+    return [ndb.Key(SeatShard, '%s-%d' % (wsck, i)) for i in range(count)]
+
+
+@ndb.tasklet
+def prefetchShardsAsync(c_keys):
+    """Fetch the shards of Conference keys before the Conferences
+    themselves are read; loadSeats() then hits the ndb context cache.
+    """
+    yield ndb.get_multi_async(
+        [key for c_key in c_keys for key in shardKeysFor(c_key)])
+
+
+def newShards(conf, seats):
+    """Set conf.seatShards and return its SeatShards holding seats in total."""
+    conf.seatShards = NUM_SHARDS
+    base, extra = divmod(max(seats, 0), NUM_SHARDS)
+    return [SeatShard(key=key, seatsAvailable=base + (1 if i < extra else 0))
+            for i, key in enumerate(shardKeys(conf))]
+
+
+@ndb.transactional(xg=True)
+def shardConference(c_key):
+    """Move a legacy Conference's seatsAvailable onto seat shards."""
+    conf = c_key.get()
+    if not conf.seatShards:
+        ndb.put_multi([conf] + newShards(conf, conf.seatsAvailable or 0))
+    return conf
+
+
+def loadSeats(confs):
+    """Set exact seatsAvailable on Conference entities (in memory only)
+    with one get_multi over all their shards.
+    """
+    return loadSeatsAsync(confs).get_result()
+
+
+@ndb.tasklet
+def loadSeatsAsync(confs):
+    """Tasklet version of loadSeats()."""
+    sharded = [conf for conf in confs if conf and conf.seatShards]
+    keys = [shardKeys(conf) for conf in sharded]
+    shards = yield ndb.get_multi_async([key for ks in keys for key in ks])
+    shards = iter(shards)
+    for conf, ks in zip(sharded, keys):
+        conf.seatsAvailable = sum(
+            shard.seatsAvailable for shard in (next(shards) for _ in ks) if shard)
+    raise ndb.Return(confs)
+
+
+def adjustCapacity(conf, delta):
+    """Add (or with negative delta, remove) seats; call inside a
+    cross-group transaction.  Return the new total of available seats,
+    or None if there are not enough free seats to remove.
+    """
+    shards = [shard for shard in ndb.get_multi(shardKeys(conf)) if shard]
+    total = sum(shard.seatsAvailable for shard in shards)
+    if total + delta < 0:
+        return None
+    for shard in shards:
+        if delta >= 0:
+            shard.seatsAvailable += delta
+            break
+        taken = min(shard.seatsAvailable, -delta)
+        shard.seatsAvailable -= taken
+        delta += taken
+    ndb.put_multi(shards)
+    return sum(shard.seatsAvailable for shard in shards)
+
+
+def scheduleSync(c_key):
+    """Enqueue one seatsAvailable sync per conference per SYNC_INTERVAL."""
+    addCoalescedTask('seats-' + c_key.urlsafe(), SYNC_URL,
+        {'websafeConferenceKey': c_key.urlsafe()}, SYNC_INTERVAL)
+
+
+def syncConference(c_key):
+    """Fold shard totals into Conference.seatsAvailable; return
+    (conference, seats before, seats after), or None if not sharded.
+    """
+    conf = c_key.get()
+    if not conf or not conf.seatShards:
+        return None
+    return _storeSeats(c_key, loadSeats([conf])[0].seatsAvailable)
+
+
+@ndb.transactional()
+def _storeSeats(c_key, seats):
+    conf = c_key.get()
+    before = conf.seatsAvailable
+    if before != seats:
+        conf.seatsAvailable = seats
+        conf.put()
+    return conf, before, seats
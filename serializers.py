@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+"""serializers.py
+
+Udacity conference server-side Python App Engine entity to ProtoRPC
+message serializers
+
+The field mapping between an ndb model and a form message is worked out
+once, when the serializer is built, instead of for every entity copied.
+
+$Id$
+
+"""
+
+from google.appengine.ext import ndb
+
+
+class FormSerializer(object):
+    """FormSerializer -- copy ndb entities of one model to one form message"""
+
+    def __init__(self, model, message, converters=None, keyFields=None):
+        """Map every message field that is also a model property, converting
+        values with converters[field] when given; keyFields maps message
+        fields to functions of the entity key.
+        """
+        converters = converters or {}
+        keyFields = keyFields or {}
+        self.message = message
+        self._fields = []
+        self._keyFields = []
+        for field in message.all_fields():
+            if isinstance(getattr(model, field.name, None), ndb.Property):
+                self._fields.append((field.name, converters.get(field.name)))
+            elif field.name in keyFields:
+                self._keyFields.append((field.name, keyFields[field.name]))
+        # forms without required fields can never fail check_initialized()
+        self._checkInitialized = any(
+            field.required for field in message.all_fields())
+
+    def toForm(self, entity, **extra):
+        """Return form for entity; extra fields are set when not empty."""
+        form = self.message()
+        for name, convert in self._fields:
+            value = getattr(entity, name)
+            setattr(form, name, convert(value) if convert else value)
+        for name, keyValue in self._keyFields:
+            setattr(form, name, keyValue(entity.key))
+        for name, value in extra.iteritems():
+            if value:
+                setattr(form, name, value)
+        if self._checkInitialized:
+            form.check_initialized()
+        return form
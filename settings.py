@@ -16,3 +16,14 @@ WEB_CLIENT_ID = '578730415608-gfdnobs7bo62l229hapma905l0slke64.apps.googleuserco
 ANDROID_CLIENT_ID = 'replace with Android client ID'
 IOS_CLIENT_ID = 'replace with iOS client ID'
 ANDROID_AUDIENCE = WEB_CLIENT_ID
+
+# Confirmation emails sent per run of the once a minute mail cron.
+MAIL_SEND_RATE = 60
+
+# Seconds that cached queryConferences pages may show old seat counts
+# after registrations; 0 drops them on every registration.
+QUERY_SEATS_STALENESS = 30
+
+# Fraction of endpoint calls and handler requests whose time and API calls
+# are recorded for /admin/stats; 0 turns recording off.
+STATS_SAMPLE_RATE = 0.1
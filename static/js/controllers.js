@@ -426,10 +426,13 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
     /**
      * Invokes the conference.queryConferences API.
      */
-    $scope.queryConferencesAll = function () {
+    $scope.queryConferencesAll = function (cursor) {
         var sendFilters = {
             filters: []
         }
+        if (cursor) {
+            sendFilters.cursor = cursor;
+        }
         for (var i = 0; i < $scope.filters.length; i++) {
             var filter = $scope.filters[i];
             if (filter.field && filter.operator && filter.value) {
@@ -458,16 +461,28 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
                         $scope.alertStatus = 'success';
                         $log.info($scope.messages);
 
-                        $scope.conferences = [];
+                        if (!cursor) {
+                            $scope.conferences = [];
+                        }
                         angular.forEach(resp.items, function (conference) {
                             $scope.conferences.push(conference);
                         });
+                        $scope.nextCursor = resp.nextCursor;
                     }
                     $scope.submitted = true;
                 });
             });
     }
 
+    /**
+     * Fetches the next page of conferences for the current filters.
+     */
+    $scope.loadMoreConferences = function () {
+        if ($scope.nextCursor) {
+            $scope.queryConferencesAll($scope.nextCursor);
+        }
+    };
+
     /**
      * Invokes the conference.getConferencesCreated method.
      */
@@ -547,6 +562,12 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
  * @description
  * A controller used for the conference detail page.
  */
+/**
+ * Conferences last returned by getConference, by websafe key, so that a
+ * "not modified" response can be served from them.
+ */
+conferenceApp.conferenceCache = {};
+
 conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $log, $routeParams, HTTP_ERRORS) {
     $scope.conference = {};
 
@@ -559,8 +580,10 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
      */
     $scope.init = function () {
         $scope.loading = true;
+        var cached = conferenceApp.conferenceCache[$routeParams.websafeConferenceKey];
         gapi.client.conference.getConference({
-            websafeConferenceKey: $routeParams.websafeConferenceKey
+            websafeConferenceKey: $routeParams.websafeConferenceKey,
+            ifNoneMatch: cached && cached.etag
         }).execute(function (resp) {
             $scope.$apply(function () {
                 $scope.loading = false;
@@ -572,9 +595,15 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
                     $scope.alertStatus = 'warning';
                     $log.error($scope.messages);
                 } else {
-                    // The request has succeeded.
+                    // The request has succeeded; an unchanged conference
+                    // comes back as notModified only.
                     $scope.alertStatus = 'success';
-                    $scope.conference = resp.result;
+                    if (resp.result.notModified && cached) {
+                        $scope.conference = cached;
+                    } else {
+                        $scope.conference = resp.result;
+                        conferenceApp.conferenceCache[$routeParams.websafeConferenceKey] = resp.result;
+                    }
                 }
             });
         });
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+"""test_mailer.py
+
+Tests of the confirmation mail pull queue and the /crons/send_mail job.
+
+$Id$
+
+"""
+
+import unittest
+
+import testbase
+
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+import mailer
+from models import Conference
+from models import Profile
+from settings import MAIL_SEND_RATE
+
+
+class MailerTest(testbase.AppTestCase):
+
+    def setUp(self):
+        super(MailerTest, self).setUp()
+        self.mailStub = self.testbed.get_stub(testbed.MAIL_SERVICE_NAME)
+        self.owner = ndb.Key(Profile, 'owner@example.com')
+
+    def queueConference(self, i=0, email='owner@example.com'):
+        """Store a Conference and queue its confirmation; return its key."""
+        c_key = Conference(parent=self.owner, name='Conference %d' % i,
+            organizerUserId=self.owner.id(), city='London',
+            topics=['Web'], maxAttendees=10).put()
+        mailer.queueConfirmation(email, c_key)
+        return c_key
+
+    def backlog(self):
+        return taskqueue.Queue(mailer.MAIL_QUEUE).fetch_statistics().tasks
+
+    def testLeaseAndSend(self):
+        self.queueConference(email='alice@example.com')
+        counts = mailer.sendQueued()
+        self.assertEqual(counts['sent'], 1)
+        messages = self.mailStub.get_sent_messages(to='alice@example.com')
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0].subject, mailer.CONFIRMATION_SUBJECT)
+        self.assertIn('Conference 0', messages[0].body.decode())
+        self.assertEqual(self.backlog(), 0)
+
+    def testQueueingTwiceSendsOnce(self):
+        c_key = self.queueConference()
+        mailer.queueConfirmation('owner@example.com', c_key)
+        self.assertEqual(mailer.sendQueued()['sent'], 1)
+        self.assertEqual(len(self.mailStub.get_sent_messages()), 1)
+
+    def testLeaseExpiredAfterSendIsNotResent(self):
+        c_key = self.queueConference()
+        # an earlier run sent the email but its lease ran out before the
+        # task was deleted: the claim marker is still in memcache
+        memcache.add(mailer.SENT_PREFIX + 'confirm-' + c_key.urlsafe(), 1)
+        counts = mailer.sendQueued()
+        self.assertEqual(counts['duplicates'], 1)
+        self.assertEqual(counts['sent'], 0)
+        self.assertEqual(self.mailStub.get_sent_messages(), [])
+        self.assertEqual(self.backlog(), 0)
+
+    def testSendRateCap(self):
+        for i in range(MAIL_SEND_RATE + 5):
+            self.queueConference(i)
+        self.assertEqual(mailer.sendQueued()['sent'], MAIL_SEND_RATE)
+        self.assertEqual(len(self.mailStub.get_sent_messages()), MAIL_SEND_RATE)
+        self.assertEqual(self.backlog(), 5)
+        self.assertEqual(mailer.sendQueued()['sent'], 5)
+        self.assertEqual(self.backlog(), 0)
+
+    def testCronHandler(self):
+        import main
+        self.queueConference()
+        response = main.app.get_response('/crons/send_mail')
+        self.assertEqual(response.status_int, 204)
+        self.assertEqual(len(self.mailStub.get_sent_messages()), 1)
+        self.assertEqual(mailer.getStats()['sent'], 1)
+
+    def testStatsHandler(self):
+        import json
+        import main
+        self.queueConference()
+        mailer.sendQueued()
+        response = main.app.get_response('/admin/mail_stats')
+        self.assertEqual(response.status_int, 200)
+        stats = json.loads(response.body)
+        self.assertEqual(stats['sent'], 1)
+        self.assertEqual(stats['backlog'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
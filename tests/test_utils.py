@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+"""test_utils.py
+
+Tests of the OAuth token to user id resolution in utils.py, against a
+fake tokeninfo service.
+
+$Id$
+
+"""
+
+import hashlib
+import json
+import time
+import unittest
+
+import testbase
+
+from google.appengine.api import apiproxy_stub
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.api import memcache
+
+import utils
+
+
+class FakeTokenInfo(apiproxy_stub.APIProxyStub):
+    """urlfetch stub answering every fetch with one canned response."""
+
+    def __init__(self):
+        super(FakeTokenInfo, self).__init__('urlfetch')
+        self.urls = []
+        self.reply(200, {})
+
+    def reply(self, status, body):
+        self.status = status
+        self.content = body if isinstance(body, str) else json.dumps(body)
+
+    def _Dynamic_Fetch(self, request, response):
+        self.urls.append(request.url())
+        response.set_statuscode(self.status)
+        response.set_content(self.content)
+
+
+class OAuthUserIdTest(testbase.AppTestCase):
+
+    def setUp(self):
+        super(OAuthUserIdTest, self).setUp()
+        self.tokeninfo = FakeTokenInfo()
+        apiproxy_stub_map.apiproxy.ReplaceStub('urlfetch', self.tokeninfo)
+        utils._tokenCache.clear()
+
+    def userId(self, token='token', token_type='access_token'):
+        return utils.getOAuthUserIdAsync(token, token_type).get_result()
+
+    def testCachedInProcessThenInMemcache(self):
+        self.tokeninfo.reply(200, {'user_id': '42', 'expires_in': 600})
+        self.assertEqual(self.userId(), '42')
+        self.assertEqual(self.userId(), '42')
+        self.assertEqual(len(self.tokeninfo.urls), 1)
+        # another instance has an empty LRU but shares memcache
+        utils._tokenCache.clear()
+        self.assertEqual(self.userId(), '42')
+        self.assertEqual(len(self.tokeninfo.urls), 1)
+
+    def testTtlCappedByExpiresIn(self):
+        self.tokeninfo.reply(200, {'user_id': '42', 'expires_in': 30})
+        self.userId()
+        tokenHash = hashlib.sha256('token').hexdigest()
+        userId, expires = memcache.get(utils.TOKEN_PREFIX + tokenHash)
+        self.assertEqual(userId, '42')
+        self.assertLessEqual(expires - time.time(), 30)
+
+    def testTtlCappedByMaxTokenTtl(self):
+        self.tokeninfo.reply(200, {'user_id': '42',
+                                   'expires_in': 10 * utils.MAX_TOKEN_TTL})
+        self.userId()
+        tokenHash = hashlib.sha256('token').hexdigest()
+        _, expires = utils._tokenCache[tokenHash]
+        self.assertLessEqual(expires - time.time(), utils.MAX_TOKEN_TTL)
+
+    def testExpiredTokenNotCached(self):
+        self.tokeninfo.reply(200, {'user_id': '42', 'expires_in': 0})
+        self.userId()
+        self.userId()
+        self.assertEqual(len(self.tokeninfo.urls), 2)
+
+    def testInvalidAccessTokenNotRetried(self):
+        self.tokeninfo.reply(400, '{"error": "invalid_token"}')
+        self.assertEqual(self.userId(), '')
+        self.assertEqual(len(self.tokeninfo.urls), 1)
+
+    def testInvalidIdTokenTriedOnceAsAccessToken(self):
+        self.tokeninfo.reply(400, '{"error": "invalid_token"}')
+        self.assertEqual(self.userId(token_type='id_token'), '')
+        self.assertEqual(len(self.tokeninfo.urls), 2)
+        self.assertIn('access_token=token', self.tokeninfo.urls[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
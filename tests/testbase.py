@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+"""testbase.py
+
+Udacity conference server-side Python App Engine test support: puts the
+app and the App Engine SDK on sys.path and runs each test on fresh
+testbed service stubs.
+
+Run from the app directory with the App Engine SDK on PYTHONPATH:
+
+    python -m unittest discover -s tests
+
+$Id$
+
+"""
+
+import os
+import sys
+import unittest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+import dev_appserver
+dev_appserver.fix_sys_path()
+
+from google.appengine.datastore import datastore_stub_util
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+
+class AppTestCase(unittest.TestCase):
+    """TestCase with in-memory datastore, memcache, taskqueue, mail and
+    urlfetch stubs; queue.yaml is read from the app directory.
+    """
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.setup_env(app_id='dev~conference-test', overwrite=True)
+        policy = datastore_stub_util.PseudoRandomHRConsistencyPolicy(probability=1)
+        self.testbed.init_datastore_v3_stub(consistency_policy=policy)
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub(root_path=APP_DIR)
+        self.testbed.init_mail_stub()
+        self.testbed.init_urlfetch_stub()
+        self.testbed.init_app_identity_stub()
+        self.testbed.init_search_stub()
+        ndb.get_context().clear_cache()
+
+    def tearDown(self):
+        self.testbed.deactivate()
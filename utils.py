@@ -1,14 +1,53 @@
+import hashlib
 import json
 import os
+import threading
 import time
 import uuid
+from collections import OrderedDict
 
+from google.appengine.api import taskqueue
 from google.appengine.api import urlfetch
+from google.appengine.ext import ndb
 from models import Profile
 
+TOKENINFO_URL = 'https://www.googleapis.com/oauth2/v1/tokeninfo'
+TOKENINFO_ATTEMPTS = 3
+TOKENINFO_BACKOFF = 0.5     # seconds before the first retry, then doubled
+TOKEN_PREFIX = "TOKEN_USER_ID:"
+TOKEN_CACHE_SIZE = 1000
+MAX_TOKEN_TTL = 60 * 60
+
+# token hash -> (user id, expiry time), least recently used first
+_tokenCache = OrderedDict()
+_tokenLock = threading.Lock()
+
+
+def addCoalescedTask(name, url, params, interval):
+    """Enqueue at most one task per name every interval seconds.
+
+    The task is named after the current interval and runs once the interval
+    has ended, so it sees every change made during the interval; later adds
+    in the same interval are dropped as duplicates.
+    """
+    current = int(time.time() // interval)
+    try:
+        taskqueue.add(name='%s-%d' % (name, current), params=params, url=url,
+            countdown=(current + 1) * interval - time.time())
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        pass
+
 def getUserId(user, id_type="email"):
+    return getUserIdAsync(user, id_type).get_result()
+
+
+@ndb.tasklet
+def getUserIdAsync(user, id_type="email"):
+    """Tasklet version of getUserId(); callers overlap the OAuth token
+    lookup with their own datastore reads.
+    """
     if id_type == "email":
-        return user.email()
+        raise ndb.Return(user.email())
 
     if id_type == "oauth":
         """A workaround implementation for getting userid."""
@@ -17,22 +56,8 @@ def getUserId(user, id_type="email"):
         token_type = 'id_token'
         if 'OAUTH_USER_ID' in os.environ:
             token_type = 'access_token'
-        url = ('https://www.googleapis.com/oauth2/v1/tokeninfo?%s=%s'
-               % (token_type, token))
-        user = {}
-        wait = 1
-        for i in range(3):
-            resp = urlfetch.fetch(url)
-            if resp.status_code == 200:
-                user = json.loads(resp.content)
-                break
-            elif resp.status_code == 400 and 'invalid_token' in resp.content:
-                url = ('https://www.googleapis.com/oauth2/v1/tokeninfo?%s=%s'
-                       % ('access_token', token))
-            else:
-                time.sleep(wait)
-                wait = wait + i
-        return user.get('user_id', '')
+        userId = yield getOAuthUserIdAsync(token, token_type)
+        raise ndb.Return(userId)
 
     if id_type == "custom":
         # implement your own user_id creation and getting algorythm
@@ -40,6 +65,76 @@ def getUserId(user, id_type="email"):
         # and generates an id if profile does not exist for an email
         profile = Conference.query(Conference.mainEmail == user.email())
         if profile:
-            return profile.id()
+            raise ndb.Return(profile.id())
         else:
-            return str(uuid.uuid1().get_hex())
+            raise ndb.Return(str(uuid.uuid1().get_hex()))
+
+
+def _cachedUserId(tokenHash):
+    """Return the user id cached in this instance for a token, or None."""
+    with _tokenLock:
+        entry = _tokenCache.pop(tokenHash, None)
+        if entry and entry[1] > time.time():
+            _tokenCache[tokenHash] = entry
+            return entry[0]
+    return None
+
+
+def _cacheUserId(tokenHash, userId, expires):
+    with _tokenLock:
+        _tokenCache.pop(tokenHash, None)
+        _tokenCache[tokenHash] = (userId, expires)
+        while len(_tokenCache) > TOKEN_CACHE_SIZE:
+            _tokenCache.popitem(last=False)
+
+
+@ndb.tasklet
+def getOAuthUserIdAsync(token, token_type='id_token'):
+    """Return the user id of an OAuth token ('' if invalid), cached in
+    this instance and in memcache, keyed by token hash, until the token
+    expires.
+    """
+    tokenHash = hashlib.sha256(token).hexdigest()
+    userId = _cachedUserId(tokenHash)
+    if userId:
+        raise ndb.Return(userId)
+
+    ctx = ndb.get_context()
+    cached = yield ctx.memcache_get(TOKEN_PREFIX + tokenHash)
+    if cached and cached[1] > time.time():
+        _cacheUserId(tokenHash, *cached)
+        raise ndb.Return(cached[0])
+
+    info = yield _fetchTokenInfoAsync(token, token_type)
+    userId = info.get('user_id', '')
+    ttl = min(int(info.get('expires_in', 0)), MAX_TOKEN_TTL)
+    if userId and ttl > 0:
+        expires = time.time() + ttl
+        _cacheUserId(tokenHash, userId, expires)
+        yield ctx.memcache_set(TOKEN_PREFIX + tokenHash, (userId, expires), time=ttl)
+    raise ndb.Return(userId)
+
+
+@ndb.tasklet
+def _fetchTokenInfoAsync(token, token_type):
+    """Return the tokeninfo service's dict for a token, or {} if it is
+    invalid or the service keeps failing.
+    """
+    ctx = ndb.get_context()
+    wait = TOKENINFO_BACKOFF
+    for attempt in range(TOKENINFO_ATTEMPTS):
+        try:
+            resp = yield ctx.urlfetch('%s?%s=%s' % (TOKENINFO_URL, token_type, token))
+        except urlfetch.Error:
+            resp = None
+        if resp and resp.status_code == 200:
+            raise ndb.Return(json.loads(resp.content))
+        if resp and resp.status_code == 400 and 'invalid_token' in resp.content:
+            if token_type == 'access_token':
+                break
+            token_type = 'access_token'
+        elif attempt + 1 < TOKENINFO_ATTEMPTS:
+            # wait on the event loop; other RPCs of the request keep going
+            yield ndb.sleep(wait)
+            wait *= 2
+    raise ndb.Return({})